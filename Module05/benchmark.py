@@ -0,0 +1,354 @@
+import argparse
+import gzip
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+for exercise in ("ex0", "ex1", "ex2"):
+    sys.path.insert(0, os.path.join(HERE, exercise))
+
+import data_stream  # noqa: E402
+import nexus_pipeline  # noqa: E402
+import stream_processor  # noqa: E402
+
+# NexusManager advertises this in the nexus_pipeline demo
+ADVERTISED_CAPACITY = 1000.0
+
+
+def make_json_records(size: int, rng: random.Random) -> List[str]:
+    return [
+        json.dumps({"sensor": "temp", "value": round(rng.uniform(10, 35), 1),
+                    "unit": "C"})
+        for _ in range(size)
+    ]
+
+
+def make_ndjson_records(size: int, rng: random.Random) -> List[str]:
+    # The first line outgrows InputStage's 256-byte window, so only the
+    # tail shows a line boundary
+    lines = [json.dumps({"sensor": "temp", "value": 21.5, "unit": "C",
+                         "note": "x" * 300})]
+    lines += make_json_records(5, rng)
+    return ["\n".join(lines) for _ in range(max(1, size // 100))]
+
+
+def make_csv_records(size: int, rng: random.Random) -> List[str]:
+    actions = ("login", "logout", "view", "click")
+    return [
+        f"user{rng.randrange(1000)},{rng.choice(actions)},{1700000000 + i}"
+        for i in range(size)
+    ]
+
+
+def make_stream_records(size: int, rng: random.Random) -> List[str]:
+    return ["Real-time sensor stream"] * size
+
+
+def build_pipeline(cls: Any, pipeline_id: str) -> Any:
+    pipeline = cls(pipeline_id)
+    pipeline.add_stage(nexus_pipeline.InputStage())
+    pipeline.add_stage(nexus_pipeline.TransformStage())
+    pipeline.add_stage(nexus_pipeline.OutputStage())
+    return pipeline
+
+
+def build_manager() -> Any:
+    manager = nexus_pipeline.NexusManager()
+    adapters = (
+        (nexus_pipeline.JSONAdapter, "JSON_PIPE", "json"),
+        (nexus_pipeline.CSVAdapter, "CSV_PIPE", "csv"),
+        (nexus_pipeline.StreamAdapter, "STREAM_PIPE", "stream"),
+    )
+    for cls, pipeline_id, fmt in adapters:
+        manager.add_pipeline(build_pipeline(cls, pipeline_id))
+        manager.router.route_format(fmt, pipeline_id)
+    return manager
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(fraction * len(ordered)))
+    return ordered[index]
+
+
+def measure(name: str, calls: List[Callable[[], Any]], records: int,
+            repeat: int) -> Dict[str, Any]:
+    # Timing and memory use separate passes: tracemalloc itself slows
+    # allocation-heavy code down and would skew throughput.
+    latencies: List[float] = []
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for call in calls:
+            call_start = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - call_start)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    for call in calls:
+        call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "name": name,
+        "records": records,
+        "calls": len(calls),
+        "seconds": best,
+        "records_per_second": records / best if best else 0.0,
+        "latency_p50": percentile(latencies, 0.50),
+        "latency_p95": percentile(latencies, 0.95),
+        "latency_p99": percentile(latencies, 0.99),
+        "peak_memory_bytes": peak,
+    }
+
+
+def check_compiled(size: int, rng: random.Random) -> List[str]:
+    # Compiled plans must print exactly what the generic stages print,
+    # including payloads whose format changes mid-pipeline (gzip)
+    samples = {
+        "JSON_PIPE": make_json_records(size, rng),
+        "CSV_PIPE": ["user,action,timestamp\n" + record
+                     for record in make_csv_records(size, rng)],
+        "STREAM_PIPE": make_stream_records(size, rng),
+    }
+    samples["JSON_PIPE"] += make_ndjson_records(size, rng)
+    samples["JSON_PIPE"] += [gzip.compress(record.encode("utf-8"))
+                             for record in samples["JSON_PIPE"]]
+    samples["CSV_PIPE"] += [gzip.compress(record.encode("utf-8"))
+                            for record in samples["CSV_PIPE"]]
+    manager = build_manager()
+    compiled = build_manager()
+    for pipeline in compiled.pipelines:
+        pipeline.compile()
+    mismatches = []
+    sniff = nexus_pipeline.InputStage().sniff
+    for record in make_ndjson_records(1, rng):
+        if sniff(record) != "ndjson":
+            mismatches.append(f"long-line NDJSON sniffed as "
+                              f"{sniff(record)!r}")
+    for pipeline_id, records in samples.items():
+        for record in records:
+            expected = manager.process(pipeline_id, record)
+            actual = compiled.process(pipeline_id, record)
+            if expected != actual:
+                mismatches.append(f"{pipeline_id}: {expected!r} compiled "
+                                  f"as {actual!r}")
+    return mismatches
+
+
+def nexus_scenarios(size: int, rng: random.Random
+                    ) -> List[Tuple[str, List[Callable[[], Any]], int]]:
+    workloads = {
+        "json": ("JSON_PIPE", make_json_records(size, rng)),
+        "csv": ("CSV_PIPE", make_csv_records(size, rng)),
+        "stream": ("STREAM_PIPE", make_stream_records(size, rng)),
+    }
+    manager = build_manager()
+    compiled = build_manager()
+    for pipeline in compiled.pipelines:
+        pipeline.compile()
+
+    scenarios = []
+    for fmt, (pipeline_id, records) in workloads.items():
+        scenarios.append((
+            f"nexus.process.{fmt}",
+            [lambda r=r, p=pipeline_id: manager.process(p, r)
+             for r in records],
+            size,
+        ))
+        scenarios.append((
+            f"nexus.compiled.{fmt}",
+            [lambda r=r, p=pipeline_id: compiled.process(p, r)
+             for r in records],
+            size,
+        ))
+        scenarios.append((
+            f"nexus.process_many.{fmt}",
+            [lambda r=records, p=pipeline_id: manager.process_many(p, r)],
+            size,
+        ))
+    mixed = [record for _, records in workloads.values()
+             for record in records]
+    rng.shuffle(mixed)
+    scenarios.append((
+        "nexus.dispatch_many.mixed",
+        [lambda: manager.dispatch_many(mixed)],
+        len(mixed),
+    ))
+    return scenarios
+
+
+def data_stream_scenarios(size: int, rng: random.Random, batch: int
+                          ) -> List[Tuple[str, List[Callable[[], Any]], int]]:
+    keys = ("temp", "humidity", "pressure")
+    sensor = [f"{rng.choice(keys)}:{rng.uniform(0, 100):.1f}"
+              for _ in range(size)]
+    trans = [f"{rng.choice(('buy', 'sell'))}:{rng.randrange(1, 500)}"
+             for _ in range(size)]
+    events = [rng.choice(("login", "logout", "error", "view"))
+              for _ in range(size)]
+    streams = {
+        "SENSOR": (data_stream.SensorStream("SENSOR"), sensor),
+        "TRANS": (data_stream.TransactionStream("TRANS"), trans),
+        "EVENT": (data_stream.EventStream("EVENT"), events),
+    }
+
+    scenarios = []
+    for sid, (stream, items) in streams.items():
+        batches = [items[i:i + batch] for i in range(0, size, batch)]
+        scenarios.append((
+            f"data_stream.{sid.lower()}",
+            [lambda s=stream, b=b: s.process_batch(b) for b in batches],
+            size,
+        ))
+    processor = data_stream.StreamProcessor(
+        [stream for stream, _ in streams.values()]
+    )
+    rounds = [
+        {sid: items[i:i + batch] for sid, (_, items) in streams.items()}
+        for i in range(0, size, batch)
+    ]
+    scenarios.append((
+        "data_stream.process_all",
+        [lambda r=r: processor.process_all(r) for r in rounds],
+        size * len(streams),
+    ))
+    return scenarios
+
+
+def stream_processor_scenarios(size: int, rng: random.Random, batch: int
+                               ) -> List[Tuple[str, List[Callable[[], Any]],
+                                               int]]:
+    numeric = [[rng.randrange(1000) for _ in range(batch)]
+               for _ in range(max(1, size // batch))]
+    words = ("nexus", "stream", "data", "quest", "pipeline")
+    text = [" ".join(rng.choice(words) for _ in range(12))
+            for _ in range(size)]
+    logs = [f"{rng.choice(('ERROR', 'INFO'))}: event {i}"
+            for i in range(size)]
+    numeric_proc = stream_processor.NumericProcessor()
+    text_proc = stream_processor.TextProcessor()
+    log_proc = stream_processor.LogProcessor()
+    return [
+        ("stream_processor.numeric",
+         [lambda d=d: numeric_proc.process(d) for d in numeric],
+         len(numeric) * batch),
+        ("stream_processor.text",
+         [lambda d=d: text_proc.process(d) for d in text], size),
+        ("stream_processor.log",
+         [lambda d=d: log_proc.process(d) for d in logs], size),
+    ]
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str,
+            tolerance: float) -> List[str]:
+    with open(baseline_path, encoding="utf-8") as handle:
+        baseline = {
+            entry["name"]: entry for entry in json.load(handle)["results"]
+        }
+    regressions = []
+    for entry in results:
+        previous = baseline.get(entry["name"])
+        if previous is None or not previous["records_per_second"]:
+            continue
+        ratio = entry["records_per_second"] / previous["records_per_second"]
+        if ratio < 1.0 - tolerance:
+            regressions.append(
+                f"{entry['name']}: {entry['records_per_second']:,.0f} rec/s "
+                f"vs {previous['records_per_second']:,.0f} baseline "
+                f"({(1.0 - ratio) * 100:.0f}% slower)"
+            )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Module05 processing engines."
+    )
+    parser.add_argument("--size", type=int, default=10000,
+                        help="records per workload (default: 10000)")
+    parser.add_argument("--batch", type=int, default=100,
+                        help="items per batch for batch APIs (default: 100)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="timing runs per scenario; best is kept")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="benchmark_results.json",
+                        help="where to write the JSON results")
+    parser.add_argument("--baseline",
+                        help="previous results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed throughput drop vs baseline")
+    args = parser.parse_args(argv)
+    if args.size < 1 or args.batch < 1 or args.repeat < 1:
+        parser.error("--size, --batch and --repeat must be positive")
+
+    rng = random.Random(args.seed)
+    mismatches = check_compiled(min(args.size, 200), rng)
+    scenarios = (
+        nexus_scenarios(args.size, rng)
+        + data_stream_scenarios(args.size, rng, args.batch)
+        + stream_processor_scenarios(args.size, rng, args.batch)
+    )
+
+    print("=== CODE NEXUS - BENCHMARK SUITE ===\n")
+    results = []
+    for name, calls, records in scenarios:
+        result = measure(name, calls, records, args.repeat)
+        results.append(result)
+        print(
+            f"{name:<32} {result['records_per_second']:>12,.0f} rec/s  "
+            f"p95 {result['latency_p95'] * 1e6:>9.1f}us  "
+            f"peak {result['peak_memory_bytes'] / 1024:>9.1f} KiB"
+        )
+
+    nexus = [r for r in results if r["name"].startswith("nexus.process.")]
+    slowest = min(r["records_per_second"] for r in nexus)
+    meets = slowest >= ADVERTISED_CAPACITY
+    print(
+        f"\nAdvertised capacity: {ADVERTISED_CAPACITY:,.0f} streams/second, "
+        f"slowest per-record pipeline: {slowest:,.0f} "
+        f"({'OK' if meets else 'BELOW CLAIM'})"
+    )
+
+    report = {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "size": args.size,
+        "batch": args.batch,
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "advertised_capacity": ADVERTISED_CAPACITY,
+        "meets_advertised_capacity": meets,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2)
+    print(f"Results written to {args.output}")
+
+    status = 0 if meets else 1
+    for line in mismatches[:10]:
+        print(f"COMPILED MISMATCH {line}")
+    if mismatches:
+        status = 1
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
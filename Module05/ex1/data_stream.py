@@ -1,5 +1,377 @@
+import asyncio
+import functools
+import math
+import operator
+import re
+import time
 from abc import abstractmethod, ABC
-from typing import Any, Dict, List, Optional, Union
+from array import array
+from collections import deque
+from itertools import compress
+from concurrent.futures import Executor
+from typing import (Any, AsyncIterable, AsyncIterator, Callable, Deque, Dict,
+                    Iterable, Iterator, List, Optional, Sequence, Set, Tuple,
+                    Union)
+
+
+class QuantileSketch:
+    # Compacting sketch: level i holds samples that each stand for 2**i
+    # values. A full level is sorted and every other sample moves up, so
+    # memory stays around k * log2(n / k) while rank error stays well
+    # under one percent. Sketches merge level by level.
+    def __init__(self, k: int = 512) -> None:
+        if k < 2:
+            raise ValueError("k must be at least 2")
+        self.k = k
+        self.count = 0
+        self.levels: List[List[float]] = [[]]
+        self._offset = 0
+
+    def update(self, values: Iterable[float]) -> None:
+        before = len(self.levels[0])
+        self.levels[0].extend(values)
+        self.count += len(self.levels[0]) - before
+        self._compact()
+
+    def merge(self, other: "QuantileSketch") -> None:
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.count += other.count
+        self._compact()
+
+    def _compact(self) -> None:
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) >= self.k:
+                items.sort()
+                even = len(items) - len(items) % 2
+                # Alternate which half survives so rounding doesn't drift
+                promoted = items[self._offset:even:2]
+                self._offset ^= 1
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                self.levels[level + 1].extend(promoted)
+                self.levels[level] = items[even:]
+            level += 1
+
+    def quantile(self, fraction: float) -> float:
+        weighted = sorted(
+            (value, 1 << level)
+            for level, items in enumerate(self.levels) for value in items
+        )
+        if not weighted:
+            return 0.0
+        target = fraction * sum(weight for _, weight in weighted)
+        seen = 0
+        for value, weight in weighted:
+            seen += weight
+            if seen >= target:
+                return value
+        return weighted[-1][0]
+
+
+class StreamingSummary:
+    # Welford/Chan running moments plus min, max and a quantile sketch;
+    # batches fold in without keeping the raw values
+    def __init__(self, k: int = 512) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.sketch = QuantileSketch(k)
+
+    def update(self, values: Sequence[float]) -> None:
+        count = len(values)
+        if not count:
+            return
+        mean = sum(values) / count
+        m2 = sum((value - mean) ** 2 for value in values)
+        self._combine(count, mean, m2, min(values), max(values))
+        self.sketch.update(values)
+
+    def merge(self, other: "StreamingSummary") -> None:
+        if not other.count:
+            return
+        self._combine(other.count, other.mean, other.m2,
+                      other.minimum, other.maximum)
+        self.sketch.merge(other.sketch)
+
+    def _combine(self, count: int, mean: float, m2: float,
+                 minimum: float, maximum: float) -> None:
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.minimum = min(self.minimum, minimum)
+        self.maximum = max(self.maximum, maximum)
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def to_dict(self) -> Dict[str, float]:
+        if not self.count:
+            return {"count": 0}
+        return {"count": self.count, "mean": self.mean,
+                "variance": self.variance,
+                "stddev": math.sqrt(self.variance),
+                "min": self.minimum, "max": self.maximum,
+                "p50": self.sketch.quantile(0.50),
+                "p95": self.sketch.quantile(0.95),
+                "p99": self.sketch.quantile(0.99)}
+
+
+_FILTER_TOKEN = re.compile(
+    r"\s*(?:(-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)"
+    r"|([A-Za-z_]\w*)|(>=|<=|==|!=|>|<|\(|\))|(\S))"
+)
+_FILTER_KEYWORDS = ("and", "or", "not")
+_FILTER_OPS = {">=": operator.ge, "<=": operator.le, ">": operator.gt,
+               "<": operator.lt, "==": operator.eq, "!=": operator.ne}
+_REFLECTED_OPS = {">=": operator.le, "<=": operator.ge, ">": operator.lt,
+                  "<": operator.gt, "==": operator.eq, "!=": operator.ne}
+
+
+class FilterExpression:
+    # Compiled form of expressions like "temp >= 30 and humidity < 50".
+    # matches_row evaluates the whole expression against a row of fields
+    # (a missing field makes its comparison false). Rules joined by "or"
+    # that each test one field are per_field: they keep single readings
+    # and column values. and/not across fields needs rows instead: filter
+    # groups consecutive readings into rows (a repeated key starts the
+    # next row) and keeps the readings of matching rows, and select
+    # needs aligned columns of equal length.
+    def __init__(self, expression: str) -> None:
+        self.expression = expression
+        self._tokens = self._tokenize(expression)
+        self._pos = 0
+        self._tree = self._parse_or()
+        if self._pos != len(self._tokens):
+            raise ValueError(f"Unexpected token "
+                             f"{self._tokens[self._pos][1]!r} "
+                             f"in filter {expression!r}")
+        del self._tokens
+        self.fields = frozenset(self._fields(self._tree))
+        self.per_field = not self._mixes_fields(self._tree)
+        self._row = self._row_test(self._tree)
+        self._predicates: Dict[str, Optional[Callable[[float], bool]]] = {}
+
+    @staticmethod
+    def _tokenize(expression: str) -> List[Tuple[str, str]]:
+        tokens = []
+        for number, name, symbol, bad in _FILTER_TOKEN.findall(expression):
+            if bad:
+                raise ValueError(f"Unexpected character {bad!r} "
+                                 f"in filter {expression!r}")
+            if number:
+                value = float(number)
+                if not math.isfinite(value):
+                    raise ValueError(f"Number out of range: {number}")
+                tokens.append(("num", number))
+            elif name:
+                kind = name if name in _FILTER_KEYWORDS else "name"
+                tokens.append((kind, name))
+            else:
+                tokens.append((symbol, symbol))
+        if not tokens:
+            raise ValueError("Empty filter expression")
+        return tokens
+
+    def _take(self, *kinds: str) -> Optional[Tuple[str, str]]:
+        if self._pos < len(self._tokens):
+            token = self._tokens[self._pos]
+            if token[0] in kinds:
+                self._pos += 1
+                return token
+        return None
+
+    def _expect(self, *kinds: str) -> Tuple[str, str]:
+        token = self._take(*kinds)
+        if token is None:
+            found = (repr(self._tokens[self._pos][1])
+                     if self._pos < len(self._tokens) else "end of input")
+            raise ValueError(f"Expected {' or '.join(kinds)}, found {found} "
+                             f"in filter {self.expression!r}")
+        return token
+
+    def _parse_or(self) -> Tuple:
+        node = self._parse_and()
+        while self._take("or"):
+            node = ("or", node, self._parse_and())
+        return node
+
+    def _parse_and(self) -> Tuple:
+        node = self._parse_not()
+        while self._take("and"):
+            node = ("and", node, self._parse_not())
+        return node
+
+    def _parse_not(self) -> Tuple:
+        if self._take("not"):
+            return ("not", self._parse_not())
+        if self._take("("):
+            node = self._parse_or()
+            self._expect(")")
+            return node
+        field = self._expect("name")[1]
+        op = self._expect(">=", "<=", "==", "!=", ">", "<")[0]
+        return ("cmp", field, op, float(self._expect("num")[1]))
+
+    def _fields(self, node: Tuple) -> Iterator[str]:
+        if node[0] == "cmp":
+            yield node[1]
+        else:
+            for child in node[1:]:
+                yield from self._fields(child)
+
+    def _mixes_fields(self, node: Tuple) -> bool:
+        kind = node[0]
+        if kind == "cmp":
+            return False
+        if kind != "or" and len(set(self._fields(node))) > 1:
+            return True
+        return any(self._mixes_fields(child) for child in node[1:])
+
+    def _row_test(self, node: Tuple) -> Callable[[Dict[str, float]], bool]:
+        kind = node[0]
+        if kind == "cmp":
+            _, field, op, number = node
+            compare = _FILTER_OPS[op]
+
+            def test(row: Dict[str, float]) -> bool:
+                value = row.get(field)
+                return value is not None and compare(value, number)
+            return test
+        if kind == "not":
+            inner = self._row_test(node[1])
+            return lambda row: not inner(row)
+        left = self._row_test(node[1])
+        right = self._row_test(node[2])
+        if kind == "and":
+            return lambda row: left(row) and right(row)
+        return lambda row: left(row) or right(row)
+
+    def _value_test(self, node: Tuple, field: str
+                    ) -> Optional[Callable[[float], bool]]:
+        # None when no comparison in node applies to field
+        kind = node[0]
+        if kind == "cmp":
+            if node[1] != field:
+                return None
+            # v >= n is n <= v: a partial of the reflected C operator
+            return functools.partial(_REFLECTED_OPS[node[2]], node[3])
+        if kind == "not":
+            inner = self._value_test(node[1], field)
+            if inner is None:
+                return None
+            return lambda value: not inner(value)
+        left = self._value_test(node[1], field)
+        right = self._value_test(node[2], field)
+        if left is None or right is None:
+            return left if right is None else right
+        if kind == "and":
+            return lambda value: left(value) and right(value)
+        return lambda value: left(value) or right(value)
+
+    def predicate(self, field: str) -> Optional[Callable[[float], bool]]:
+        try:
+            return self._predicates[field]
+        except KeyError:
+            pass
+        if not self.per_field:
+            raise ValueError(
+                f"Filter {self.expression!r} combines fields with and/not, "
+                f"so it has no per-field predicate (use matches_row)"
+            )
+        predicate = self._value_test(self._tree, field)
+        self._predicates[field] = predicate
+        return predicate
+
+    def matches_row(self, row: Dict[str, float]) -> bool:
+        return self._row(row)
+
+    def filter_rows(self, rows: Iterable[Dict[str, float]]
+                    ) -> List[Dict[str, float]]:
+        return list(filter(self._row, rows))
+
+    def matches(self, item: Any) -> bool:
+        if not isinstance(item, str):
+            return False
+        key, sep, raw = item.partition(":")
+        predicate = self.predicate(key)
+        if not sep or predicate is None:
+            return False
+        try:
+            return predicate(float(raw))
+        except ValueError:
+            return False
+
+    def filter(self, data_batch: Iterable[Any]) -> List[Any]:
+        if not self.per_field:
+            return self._filter_by_row(data_batch)
+        matches = self.matches
+        return [item for item in data_batch if matches(item)]
+
+    def _filter_by_row(self, data_batch: Iterable[Any]) -> List[Any]:
+        selected: List[Any] = []
+        items: List[Any] = []
+        row: Dict[str, float] = {}
+        for item in data_batch:
+            if not isinstance(item, str):
+                continue
+            key, sep, raw = item.partition(":")
+            if not sep:
+                continue
+            try:
+                value = float(raw)
+            except ValueError:
+                continue
+            if key in row:
+                if self._row(row):
+                    selected.extend(items)
+                items = []
+                row = {}
+            row[key] = value
+            items.append(item)
+        if row and self._row(row):
+            selected.extend(items)
+        return selected
+
+    def select(self, columns: Dict[str, array]) -> Dict[str, array]:
+        if not self.per_field:
+            return self._select_by_row(columns)
+        selected = {}
+        for field, values in columns.items():
+            predicate = self.predicate(field)
+            if predicate is not None:
+                selected[field] = array(values.typecode,
+                                        filter(predicate, values))
+        return selected
+
+    def _select_by_row(self, columns: Dict[str, array]
+                       ) -> Dict[str, array]:
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(
+                f"Filter {self.expression!r} combines fields with and/not "
+                f"and needs aligned columns of equal length"
+            )
+        present = [field for field in self.fields if field in columns]
+        mask = [self._row({field: columns[field][index]
+                           for field in present})
+                for index in range(lengths.pop() if lengths else 0)]
+        return {field: array(values.typecode, compress(values, mask))
+                for field, values in columns.items()}
+
+
+@functools.lru_cache(maxsize=256)
+def compile_filter(expression: str) -> FilterExpression:
+    return FilterExpression(expression)
 
 
 class DataStream(ABC):
@@ -7,140 +379,346 @@ class DataStream(ABC):
         self.stream_id = stream_id
         self.batches_processed = 0
         self.items_processed = 0
+        self.summaries: Dict[str, StreamingSummary] = {}
+
+    def process_stream(self, items: Iterable[Any], batch_size: int = 100,
+                       max_wait: Optional[float] = None) -> Iterator[str]:
+        # Pulls items lazily and yields one result per micro-batch. A batch
+        # closes at batch_size items, or when an item arrives max_wait
+        # seconds after the batch started.
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+        batch: List[Any] = []
+        started = 0.0
+        for item in items:
+            if not batch:
+                started = time.monotonic()
+            batch.append(item)
+            if len(batch) >= batch_size or (
+                    max_wait is not None
+                    and time.monotonic() - started >= max_wait):
+                yield self.process_batch(batch)
+                batch = []
+        if batch:
+            yield self.process_batch(batch)
+
+    async def process_stream_async(self, items: AsyncIterable[Any],
+                                   batch_size: int = 100,
+                                   max_wait: Optional[float] = None
+                                   ) -> AsyncIterator[str]:
+        # Like process_stream, but a quiet source can't hold a partial
+        # batch back: it is flushed max_wait seconds after it started even
+        # if no further item arrives
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+        loop = asyncio.get_running_loop()
+        iterator = items.__aiter__()
+        batch: List[Any] = []
+        deadline: Optional[float] = None
+        pending: Optional[asyncio.Future] = None
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(iterator.__anext__())
+                timeout = (None if deadline is None
+                           else max(0.0, deadline - loop.time()))
+                done, _ = await asyncio.wait({pending}, timeout=timeout)
+                if not done:
+                    yield self.process_batch(batch)
+                    batch = []
+                    deadline = None
+                    continue
+                future, pending = pending, None
+                try:
+                    item = future.result()
+                except StopAsyncIteration:
+                    break
+                if not batch and max_wait is not None:
+                    deadline = loop.time() + max_wait
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    yield self.process_batch(batch)
+                    batch = []
+                    deadline = None
+        finally:
+            if pending is not None:
+                pending.cancel()
+        if batch:
+            yield self.process_batch(batch)
+
+    def observe(self, field: str, values: Sequence[float]) -> None:
+        summary = self.summaries.get(field)
+        if summary is None:
+            summary = self.summaries[field] = StreamingSummary()
+        summary.update(values)
+
+    def merge_stats(self, other: "DataStream") -> None:
+        self.batches_processed += other.batches_processed
+        self.items_processed += other.items_processed
+        for field, theirs in other.summaries.items():
+            summary = self.summaries.get(field)
+            if summary is None:
+                summary = self.summaries[field] = StreamingSummary()
+            summary.merge(theirs)
 
     @abstractmethod
     def process_batch(self, data_batch: List[Any]) -> str:
         pass
 
+    # Named criteria each subclass maps onto a filter expression
+    filter_aliases: Dict[str, str] = {}
+
     def filter_data(self, data_batch: List[Any],
                     criteria: Optional[str] = None) -> List[Any]:
-        if criteria == "high":
+        if criteria is None:
             return data_batch
-        return data_batch
+        # Anything but a known alias must be a valid expression; a typo
+        # raises here instead of quietly returning the whole batch
+        expression = self.filter_aliases.get(criteria, criteria)
+        return compile_filter(expression).filter(data_batch)
 
-    def get_stats(self) -> Dict[str, Union[str, int, float]]:
+    def get_stats(self) -> Dict[str, Any]:
         return {"stream_id": self.stream_id,
                 "batches_processed": self.batches_processed,
-                "items_processed": self.items_processed}
+                "items_processed": self.items_processed,
+                "summaries": {field: summary.to_dict()
+                              for field, summary in self.summaries.items()}}
+
+
+def summarize_column(values: array) -> Dict[str, float]:
+    count = len(values)
+    if not count:
+        return {"count": 0, "mean": 0.0, "min": 0.0, "max": 0.0}
+    return {"count": count, "mean": sum(values) / count,
+            "min": min(values), "max": max(values)}
 
 
 class SensorStream(DataStream):
+    filter_aliases = {"high": "temp >= 30"}
+
     def __init__(self, stream_id: str) -> None:
         super().__init__(stream_id)
         self.stream_type = "Environmental Data"
+        self.columns: Dict[str, array] = {}
+        self.column_stats: Dict[str, Dict[str, float]] = {}
 
     def process_batch(self, data_batch: List[Any]) -> str:
-        try:
-            if not all(isinstance(item, str) for item in data_batch):
-                return "Invalid data batch. Only strings are allowed."
-        except Exception:
-            return "Invalid data batch. Only strings are allowed."
-        temps = []
-        for item in data_batch:
-            parts = item.split(":")
-            if len(parts) != 2:
-                return "Invalid data format. Expected 'key:value'."
-            if parts[0] == "temp":
-                try:
-                    temp_value = float(parts[1])
-                    temps.append(temp_value)
-                except ValueError:
-                    return "Invalid temperature value. Must be a number."
-        avg_tmp = sum(temps) / len(temps) if temps else 0
+        columns = self.parse_columns(data_batch)
+        if isinstance(columns, str):
+            return columns
+        self.columns = columns
+        self.column_stats = {key: summarize_column(values)
+                             for key, values in columns.items()}
+        for key, values in columns.items():
+            self.observe(key, values)
         self.items_processed += len(data_batch)
         self.batches_processed += 1
 
+        temps = columns.get("temp")
+        avg_tmp = sum(temps) / len(temps) if temps else 0
         return (
             f"Sensor analysis: {len(data_batch)} readings processed, "
             f"avg temp: {avg_tmp:.1f}°C"
         )
 
-    def filter_data(self, data_batch: List[Any],
-                    criteria: Optional[str] = None) -> List[Any]:
-        if criteria == "high":
-            filtered: List[Any] = []
+    def parse_columns(self, data_batch: List[Any]
+                      ) -> Union[str, Dict[str, array]]:
+        # One pass: each "key:value" reading lands straight in a float
+        # column for its key, so no per-item lists are built
+        columns: Dict[str, array] = {}
+        try:
             for item in data_batch:
                 if not isinstance(item, str):
-                    continue
-                if not item.startswith("temp:"):
-                    continue
-
-                parts = item.split(":", 1)
-                if len(parts) != 2:
-                    continue
-
+                    return "Invalid data batch. Only strings are allowed."
+                key, sep, raw = item.partition(":")
+                if not sep or ":" in raw:
+                    return "Invalid data format. Expected 'key:value'."
                 try:
-                    value = float(parts[1])
+                    value = float(raw)
                 except ValueError:
+                    if key == "temp":
+                        return "Invalid temperature value. Must be a number."
                     continue
+                column = columns.get(key)
+                if column is None:
+                    column = columns[key] = array("d")
+                column.append(value)
+        except TypeError:
+            return "Invalid data batch. Only strings are allowed."
+        return columns
 
-                if value >= 30:
-                    filtered.append(item)
-            return filtered
-        return data_batch
+    def filter_columns(self, criteria: str,
+                       columns: Optional[Dict[str, array]] = None
+                       ) -> Dict[str, array]:
+        expression = self.filter_aliases.get(criteria, criteria)
+        if columns is None:
+            columns = self.columns
+        return compile_filter(expression).select(columns)
 
-    def get_stats(self) -> Dict[str, Union[str, int, float]]:
+    def get_stats(self) -> Dict[str, Any]:
         stats = super().get_stats()
         stats["domain"] = "sensor"
+        stats["columns"] = self.column_stats
         return stats
 
 
 class TransactionStream(DataStream):
-    def __init__(self, stream_id: str) -> None:
+    filter_aliases = {"high": "buy >= 100 or sell >= 100"}
+
+    def __init__(self, stream_id: str, history: int = 1000) -> None:
         super().__init__(stream_id)
         self.stream_type = "Financial Data"
+        self.total_bought = 0
+        self.total_sold = 0
+        self.malformed_items = 0
+        self.net_position = 0
+        # Net flow of the most recent batches, oldest first
+        self.deltas: Deque[int] = deque(maxlen=history)
 
     def process_batch(self, data_batch: List[Any]) -> str:
+        # One pass; anything that isn't a "buy:N"/"sell:N" string, including
+        # non-strings, is counted as malformed instead of failing the batch
+        buys = array("q")
+        sells = array("q")
+        malformed = 0
         try:
-            if not all(isinstance(item, str) for item in data_batch):
-                return "Invalid data batch. Only strings are allowed."
-        except Exception:
+            for item in data_batch:
+                if not isinstance(item, str):
+                    malformed += 1
+                    continue
+                kind, _, raw = item.partition(":")
+                try:
+                    if kind == "buy":
+                        buys.append(int(raw))
+                    elif kind == "sell":
+                        sells.append(int(raw))
+                    else:
+                        malformed += 1
+                except (ValueError, OverflowError):
+                    malformed += 1
+        except TypeError:
             return "Invalid data batch. Only strings are allowed."
+        bought = sum(buys)
+        sold = sum(sells)
+        self.observe("buy", buys)
+        self.observe("sell", sells)
         self.items_processed += len(data_batch)
         self.batches_processed += 1
 
-        buy = [int(item.split(":")[1])
-               for item in data_batch if item.startswith("buy:")]
-        sell = [int(item.split(":")[1])
-                for item in data_batch if item.startswith("sell:")]
-
-        net = sum(buy) - sum(sell)
+        net = bought - sold
+        self.total_bought += bought
+        self.total_sold += sold
+        self.malformed_items += malformed
+        self.net_position += net
+        self.deltas.append(net)
+        self.observe("net_flow", (net,))
+
+        skipped = ""
+        if malformed:
+            skipped = (f", {malformed} malformed "
+                       f"{'entry' if malformed == 1 else 'entries'} skipped")
         if net > 0:
             return (
                 f"Transaction analysis: {len(data_batch)} "
-                f"operations, net flow: +{net} units"
+                f"operations, net flow: +{net} units{skipped}"
             )
         return (
             f"Transaction analysis: {len(data_batch)} "
-            f"operations, net flow: {net} units"
+            f"operations, net flow: {net} units{skipped}"
             )
 
-    def filter_data(self, data_batch: List[Any],
-                    criteria: Optional[str] = None) -> List[Any]:
-        if criteria == "high":
-            filtered = []
-            for item in data_batch:
-                if not (item.startswith("buy:") or item.startswith("sell:")):
-                    continue
-                try:
-                    amount = int(item.split(":", 1)[1])
-                except ValueError:
-                    continue
-                if amount >= 100:
-                    filtered.append(item)
-            return filtered
-        return data_batch
-
-    def get_stats(self) -> Dict[str, Union[str, int, float]]:
+    def get_stats(self) -> Dict[str, Any]:
         stats = super().get_stats()
         stats["domain"] = "transaction"
+        stats["total_bought"] = self.total_bought
+        stats["total_sold"] = self.total_sold
+        stats["net_position"] = self.net_position
+        stats["malformed_items"] = self.malformed_items
         return stats
 
 
+DEFAULT_EVENT_CATEGORIES: Dict[str, Tuple[str, ...]] = {
+    "error": ("error",),
+    "warning": ("warn",),
+    "timeout": ("timeout", "timed out"),
+    "auth_failure": ("unauthorized", "access denied", "auth fail",
+                     "login failed", "invalid password"),
+}
+
+
+class EventClassifier:
+    # All keywords go into one case-insensitive pattern, so each event is
+    # scanned once however many categories there are. Every category is a
+    # lookahead, so matches are zero-width and may overlap: "dberror"
+    # counts for both "db" and "error", as select would find it in both.
+    def __init__(self, categories: Optional[Dict[str, Iterable[str]]] = None
+                 ) -> None:
+        if categories is None:
+            categories = DEFAULT_EVENT_CATEGORIES
+        self.categories: Dict[str, Tuple[str, ...]] = {}
+        self._group_categories: List[str] = []
+        groups = []
+        self._patterns: Dict[str, Any] = {}
+        for index, (category, keywords) in enumerate(categories.items()):
+            keywords = tuple(keywords)
+            if not keywords or not all(keywords):
+                raise ValueError(f"Category {category!r} needs keywords")
+            self.categories[category] = keywords
+            alternation = "|".join(
+                re.escape(word) for word in sorted(keywords, key=len,
+                                                   reverse=True)
+            )
+            self._group_categories.append(category)
+            groups.append(f"(?:(?=(?P<c{index}>{alternation})))?")
+            self._patterns[category] = re.compile(alternation, re.IGNORECASE)
+        if not groups:
+            raise ValueError("At least one event category is required")
+        # The leading lookahead only lets positions where some keyword
+        # starts match, then each optional group records its category
+        anywhere = "|".join(pattern.pattern
+                            for pattern in self._patterns.values())
+        self._pattern = re.compile(f"(?=(?:{anywhere})){''.join(groups)}",
+                                   re.IGNORECASE)
+
+    def _found(self, event: str) -> Set[int]:
+        found: Set[int] = set()
+        for match in self._pattern.finditer(event):
+            found.update(index for index, text in enumerate(match.groups())
+                         if text is not None)
+        return found
+
+    def classify(self, event: str) -> List[str]:
+        found = self._found(event)
+        return [category
+                for index, category in enumerate(self._group_categories)
+                if index in found]
+
+    def count(self, events: Iterable[str]) -> Dict[str, int]:
+        counts = dict.fromkeys(self.categories, 0)
+        categories = self._group_categories
+        found = self._found
+        for event in events:
+            for index in found(event):
+                counts[categories[index]] += 1
+        return counts
+
+    def select(self, events: Iterable[Any], category: str) -> List[Any]:
+        search = self._patterns[category].search
+        return [event for event in events
+                if isinstance(event, str) and search(event)]
+
+
 class EventStream(DataStream):
-    def __init__(self, stream_id: str) -> None:
+    filter_aliases = {"high": "error"}
+
+    def __init__(self, stream_id: str,
+                 categories: Optional[Dict[str, Iterable[str]]] = None
+                 ) -> None:
         super().__init__(stream_id)
         self.stream_type = "System Data"
+        self.classifier = EventClassifier(categories)
+        self.category_counts = dict.fromkeys(self.classifier.categories, 0)
+        self.last_counts = dict(self.category_counts)
 
     def process_batch(self, data_batch: List[Any]) -> str:
         try:
@@ -149,7 +727,12 @@ class EventStream(DataStream):
         except Exception:
             return "Invalid data batch. Only strings are allowed."
 
-        error_count = sum(1 for item in data_batch if "error" in item.lower())
+        counts = self.classifier.count(data_batch)
+        for category, count in counts.items():
+            self.category_counts[category] += count
+        self.last_counts = counts
+        error_count = counts.get("error", 0)
+        self.observe("errors_per_batch", (error_count,))
         self.items_processed += len(data_batch)
         self.batches_processed += 1
         if error_count == 1:
@@ -165,47 +748,84 @@ class EventStream(DataStream):
 
     def filter_data(self, data_batch: List[Any],
                     criteria: Optional[str] = None) -> List[Any]:
-        if criteria == "high":
-            return [item for item in data_batch if "error" in item.lower()]
-        return data_batch
+        category = self.filter_aliases.get(criteria or "", criteria)
+        if category in self.classifier.categories:
+            return self.classifier.select(data_batch, category)
+        return super().filter_data(data_batch, criteria)
 
-    def get_stats(self) -> Dict[str, Union[str, int, float]]:
+    def get_stats(self) -> Dict[str, Any]:
         stats = super().get_stats()
         stats["domain"] = "event"
+        stats["categories"] = dict(self.category_counts)
         return stats
 
 
+def _run_stream_batch(stream: DataStream, data_batch: List[Any]
+                      ) -> Tuple[str, DataStream]:
+    # Returns the stream too: in a process pool the worker mutates a copy
+    return stream.process_batch(data_batch), stream
+
+
 # Polymorphic Stream Processor
 class StreamProcessor():
-    def __init__(self, streams: List[DataStream]) -> None:
+    def __init__(self, streams: List[DataStream],
+                 executor: Optional[Executor] = None) -> None:
         self.streams = streams
+        self.executor = executor
+        self._index: Dict[str, DataStream] = {}
+        for stream in streams:
+            self._index.setdefault(stream.stream_id, stream)
 
     def add_stream(self, stream: DataStream) -> None:
         self.streams.append(stream)
+        self._index.setdefault(stream.stream_id, stream)
 
-    def process_all(self, data_batches: Dict[str, List[Any]]) -> List[str]:
-        results = []
-        stream_map = {s.stream_id: s for s in self.streams}
+    def get_stream(self, stream_id: str) -> Optional[DataStream]:
+        return self._index.get(stream_id)
+
+    def process_all(self, data_batches: Dict[str, List[Any]],
+                    executor: Optional[Executor] = None) -> List[str]:
+        executor = executor or self.executor
+        if executor is None:
+            return [self.process_batch(sid, batch)
+                    for sid, batch in data_batches.items()]
+
+        pending: List[Tuple[str, Optional[DataStream], Any]] = []
         for sid, batch in data_batches.items():
-            stream = stream_map.get(sid)
+            stream = self._index.get(sid)
+            future = None
+            if stream is not None:
+                try:
+                    future = executor.submit(_run_stream_batch, stream, batch)
+                except Exception:
+                    future = None
+            pending.append((sid, stream, future))
+
+        results = []
+        for sid, stream, future in pending:
             if stream is None:
                 results.append(f"ERROR: Stream {sid} not found.")
                 continue
             try:
-                results.append(stream.process_batch(batch))
+                result, updated = future.result()
             except Exception:
+                # Also covers a failed submit, where future is None
                 results.append(f"ERROR: Failed processing batch for {sid}.")
+                continue
+            if updated is not stream:
+                stream.__dict__.update(updated.__dict__)
+            results.append(result)
         return results
 
     def process_batch(self, stream_id: str,
                       data_batch: List[Any]) -> str:
-        for stream in self.streams:
-            if stream.stream_id == stream_id:
-                try:
-                    return stream.process_batch(data_batch)
-                except Exception:
-                    return f"ERROR: Failed processing batch for {stream_id}."
-        return f"ERROR: Stream {stream_id} not found."
+        stream = self._index.get(stream_id)
+        if stream is None:
+            return f"ERROR: Stream {stream_id} not found."
+        try:
+            return stream.process_batch(data_batch)
+        except Exception:
+            return f"ERROR: Failed processing batch for {stream_id}."
 
 
 if __name__ == "__main__":
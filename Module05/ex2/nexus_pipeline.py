@@ -1,197 +1,2543 @@
+import asyncio
+import codecs
+import csv
+import functools
+import gzip
+import hashlib
+import heapq
+import itertools
+import json
+import math
+import os
+import socket
+import string
+import sys
+import tempfile
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Protocol, Union
+from collections import OrderedDict, deque
+from collections.abc import Mapping, MutableMapping
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import (Any, AsyncIterable, AsyncIterator, Callable, Deque, Dict,
+                    Iterable, Iterator, List, NamedTuple, Optional,
+                    Protocol, Set, Tuple, Union)
+
+
+def _json_default(obj: Any) -> Any:
+    # Nested records (e.g. NDJSON "records") serialize as objects; their
+    # raw payload is left out like the top-level record's
+    if isinstance(obj, PipelineRecord):
+        return {key: value for key, value in obj.items() if key != "raw"}
+    return str(obj)
+
+
+# Use a faster JSON decoder when one is installed; both raise ValueError
+# subclasses on bad input, like the stdlib decoder.
+try:
+    import orjson
+    _json_loads: Callable[[Union[str, bytes]], Any] = orjson.loads
+
+    def _json_dumps(obj: Any) -> str:
+        return orjson.dumps(obj, default=_json_default).decode("utf-8")
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj: Any) -> str:
+        return json.dumps(obj, default=_json_default, ensure_ascii=False)
 
 
 class ProcessingStage(Protocol):
     def process(self, data: Any) -> Any:
         ...
 
+    # Optional batch hook: stages that subclass ProcessingStage inherit this
+    # per-record fallback and may override it with a batch-aware version.
+    def process_batch(self, records: List[Any]) -> List[Any]:
+        process = self.process
+        return [process(record) for record in records]
+
+
+_MISSING = object()
+
+
+class PipelineRecord(MutableMapping):
+    # Slotted inter-stage payload. Known fields live in slots; anything
+    # else goes to a lazily created overflow dict. It is a MutableMapping,
+    # so stages using item access, get or update keep working, but it is
+    # not a dict: a custom stage that tests isinstance(data, dict) must
+    # test collections.abc.Mapping instead, or it will treat the record
+    # as raw input and wrap it.
+    __slots__ = ("raw", "format", "transform_msg", "_extra")
+    _fields: Tuple[str, ...] = ("raw", "format", "transform_msg")
+    _field_set = frozenset(_fields)
+
+    def __init__(self, raw: Any = None, fmt: str = "unknown") -> None:
+        self.raw = raw
+        self.format = fmt
+        self._extra: Optional[Dict[str, Any]] = None
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in self._field_set:
+            return getattr(self, key, default)
+        if self._extra is not None:
+            return self._extra.get(key, default)
+        return default
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in self._field_set:
+            setattr(self, key, value)
+        elif self._extra is None:
+            self._extra = {key: value}
+        else:
+            self._extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key in self._field_set and hasattr(self, key):
+            delattr(self, key)
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key: Any) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __iter__(self) -> Iterator[str]:
+        for name in self._fields:
+            if hasattr(self, name):
+                yield name
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def keys(self) -> List[str]:
+        return list(self)
+
+    def items(self) -> List[Tuple[str, Any]]:
+        return [(key, self[key]) for key in self]
+
+    def values(self) -> List[Any]:
+        return [self[key] for key in self]
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            self[key] = default
+            return default
+        return value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.items())
+
+    def copy(self) -> "PipelineRecord":
+        clone = self.__class__.__new__(self.__class__)
+        for name in self._fields:
+            value = getattr(self, name, _MISSING)
+            if value is not _MISSING:
+                setattr(clone, name, value)
+        clone._extra = dict(self._extra) if self._extra else None
+        return clone
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Mapping):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    # Mutable, so unhashable like dict
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class JSONRecord(PipelineRecord):
+    __slots__ = ("value", "unit", "status")
+    _fields = PipelineRecord._fields + __slots__
+    _field_set = frozenset(_fields)
+
+
+class CSVRecord(PipelineRecord):
+    __slots__ = ("fields", "actions_processed")
+    _fields = PipelineRecord._fields + __slots__
+    _field_set = frozenset(_fields)
+
+
+class NDJSONRecord(PipelineRecord):
+    __slots__ = ("records",)
+    _fields = PipelineRecord._fields + __slots__
+    _field_set = frozenset(_fields)
+
+
+class StreamRecord(PipelineRecord):
+    __slots__ = ("readings_count", "avg_temp", "min_temp", "max_temp")
+    _fields = PipelineRecord._fields + __slots__
+    _field_set = frozenset(_fields)
+
+
+_RECORD_CLASSES: Dict[str, type] = {
+    "json": JSONRecord,
+    "ndjson": NDJSONRecord,
+    "csv": CSVRecord,
+    "stream": StreamRecord,
+}
+_RECORD_TYPES = (dict, PipelineRecord)
+
+
+def make_record(raw: Any, fmt: str) -> PipelineRecord:
+    return _RECORD_CLASSES.get(fmt, PipelineRecord)(raw, fmt)
+
+
+def _copy_record(data: Any) -> Any:
+    # Shallow copy for records, identity for immutable outputs
+    if isinstance(data, _RECORD_TYPES):
+        return data.copy()
+    return data
+
+
+def _clone_value(value: Any) -> Any:
+    # Copies records, dicts and lists recursively; other values are shared
+    if isinstance(value, _RECORD_TYPES):
+        clone = value.copy()
+        for key, item in value.items():
+            if isinstance(item, (list, dict, PipelineRecord)):
+                clone[key] = _clone_value(item)
+        return clone
+    if isinstance(value, list):
+        return [_clone_value(item)
+                if isinstance(item, (list, dict, PipelineRecord)) else item
+                for item in value]
+    return value
+
+
+def merge_records(records: List[Any]) -> Any:
+    # Fan-in merge for DAGs: a copy of the first record with the fields
+    # every later parent added laid over it in order
+    merged = _clone_value(records[0])
+    if not isinstance(merged, _RECORD_TYPES):
+        return merged
+    for record in records[1:]:
+        if isinstance(record, _RECORD_TYPES):
+            for key, value in record.items():
+                if key not in ("raw", "format"):
+                    merged[key] = _clone_value(value)
+    return merged
+
+
+def _run_chain(chain: Tuple[Callable[[Any], Any], ...],
+               data: Any) -> Any:
+    for func in chain:
+        data = func(data)
+    return data
+
+
+def _compile_plan(stages: List[ProcessingStage],
+                  on_error: Optional[Callable[[int, Any, Exception], None]]
+                  = None) -> Callable[[Any], Any]:
+    # The head stage runs generically; everything after it is resolved
+    # once per format into a flat tuple of bound callables and cached,
+    # so a record only pays for one dict lookup before the stages run.
+    # With on_error, the plan also tracks the running stage and reports
+    # (position, original record, error) before re-raising.
+    generic = tuple(stage.process for stage in stages)
+    if on_error is None and (
+            len(stages) < 2 or not hasattr(stages[1], "specialize")):
+        return functools.partial(_run_chain, generic)
+    if len(stages) < 2 or not hasattr(stages[1], "specialize"):
+        def tracked_generic(data: Any) -> Any:
+            record = data
+            position = 0
+            try:
+                for position, func in enumerate(generic):
+                    data = func(data)
+            except Exception as error:
+                on_error(position, record, error)
+                raise
+            return data
+        return tracked_generic
+
+    head = generic[0]
+    tail = stages[1:]
+    tail_generic = generic[1:]
+    chains: Dict[str, Tuple[Callable[[Any], Any], ...]] = {}
+
+    def specialize(fmt: str) -> Tuple[Callable[[Any], Any], ...]:
+        funcs: List[Callable[[Any], Any]] = []
+        emits_record = True
+        for stage in tail:
+            if emits_record and hasattr(stage, "specialize"):
+                funcs.append(stage.specialize(fmt))
+                emits_record = getattr(stage, "emits_record", True)
+                # The record may leave this stage as another format, so
+                # later stages can't be bound to this one
+                if fmt in getattr(stage, "generic_formats", ()):
+                    emits_record = False
+            else:
+                funcs.append(stage.process)
+        chain = tuple(funcs)
+        chains[fmt] = chain
+        return chain
+
+    def plan(data: Any) -> Any:
+        data = head(data)
+        if isinstance(data, _RECORD_TYPES):
+            chain = chains.get(data.get("format", "unknown"))
+            if chain is None:
+                chain = specialize(data.get("format", "unknown"))
+        else:
+            chain = tail_generic
+        for func in chain:
+            data = func(data)
+        return data
+
+    def tracked(data: Any) -> Any:
+        record = data
+        position = 0
+        try:
+            data = head(data)
+            if isinstance(data, _RECORD_TYPES):
+                chain = chains.get(data.get("format", "unknown"))
+                if chain is None:
+                    chain = specialize(data.get("format", "unknown"))
+            else:
+                chain = tail_generic
+            for position, func in enumerate(chain, 1):
+                data = func(data)
+        except Exception as error:
+            on_error(position, record, error)
+            raise
+        return data
+    return plan if on_error is None else tracked
+
+
+def _text_or_bytes(raw: Any) -> Optional[Union[str, bytes]]:
+    # Normalizes payloads for the parsers; buffer views become bytes here,
+    # once the payload is actually parsed rather than just classified
+    if isinstance(raw, str):
+        return raw[1:] if raw.startswith("\ufeff") else raw
+    if isinstance(raw, (bytearray, memoryview)):
+        raw = bytes(raw)
+    if isinstance(raw, bytes):
+        if raw.startswith(codecs.BOM_UTF8):
+            return raw[len(codecs.BOM_UTF8):]
+        return raw
+    return None
+
+
+def _record_stages(stages: List[Any]) -> List[Any]:
+    for position, stage in enumerate(stages):
+        if not getattr(stage, "emits_record", True):
+            return stages[:position]
+    return stages
+
+
+def _find_reading(doc: Any) -> Optional[Dict]:
+    # The reading is the first (shallowest) object holding value and unit
+    pending = deque([doc])
+    while pending:
+        node = pending.popleft()
+        if not isinstance(node, dict):
+            continue
+        if "value" in node and "unit" in node:
+            return node
+        pending.extend(node.values())
+    return None
+
+
+class LatencyHistogram:
+    # Log-scale buckets 10% wide: fixed memory, O(1) inserts, and
+    # percentiles within about 5% of the true latency.
+    _GROWTH = 1.1
+
+    def __init__(self) -> None:
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self._log_growth = math.log(self._GROWTH)
+
+    def add(self, seconds: float, weight: int = 1) -> None:
+        nanos = seconds * 1e9
+        bucket = int(math.log(nanos) / self._log_growth) if nanos > 1 else 0
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + weight
+        self.count += weight
+
+    def percentile(self, fraction: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return self._GROWTH ** (bucket + 0.5) / 1e9
+        return self._GROWTH ** (max(self.buckets) + 0.5) / 1e9
+
+
+class _InstrumentedStage:
+    # Counts every call and error; only every sample_every-th call is
+    # timed, and total time is extrapolated from the sampled calls.
+    def __init__(self, stage: ProcessingStage, sample_every: int) -> None:
+        self.stage = stage
+        self.name = type(stage).__name__
+        self.sample_every = sample_every
+        self.calls = 0
+        self.errors = 0
+        self.records = 0
+        self.sampled_calls = 0
+        self.sampled_records = 0
+        self.sampled_time = 0.0
+        self.latency = LatencyHistogram()
+        self.emits_record = getattr(stage, "emits_record", True)
+        if hasattr(stage, "specialize"):
+            self.specialize = self._specialize
+        if hasattr(stage, "process_async"):
+            self.process_async = self._process_async
+
+    def _observe(self, func: Callable[[Any], Any], data: Any,
+                 records: int) -> Any:
+        self.calls += 1
+        self.records += records
+        if self.calls % self.sample_every:
+            try:
+                return func(data)
+            except Exception:
+                self.errors += 1
+                raise
+        start = time.perf_counter()
+        try:
+            return func(data)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.sampled_calls += 1
+            self.sampled_records += records
+            self.sampled_time += elapsed
+            if records:
+                self.latency.add(elapsed / records, records)
+
+    def process(self, data: Any) -> Any:
+        return self._observe(self.stage.process, data, 1)
+
+    def process_batch(self, records: List[Any]) -> List[Any]:
+        return self._observe(_batch_runner(self.stage), records,
+                             len(records))
+
+    def _specialize(self, fmt: str) -> Callable[[Any], Any]:
+        func = self.stage.specialize(fmt)
+        return lambda data: self._observe(func, data, 1)
+
+    async def _process_async(self, data: Any) -> Any:
+        self.calls += 1
+        self.records += 1
+        start = time.perf_counter()
+        try:
+            return await self.stage.process_async(data)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.sampled_calls += 1
+            self.sampled_records += 1
+            self.sampled_time += elapsed
+            self.latency.add(elapsed)
+
+    @property
+    def total_time(self) -> float:
+        if not self.sampled_records:
+            return 0.0
+        return self.sampled_time * self.records / self.sampled_records
+
+    def snapshot(self) -> Dict[str, Any]:
+        total = self.total_time
+        return {
+            "stage": self.name,
+            "calls": self.calls,
+            "errors": self.errors,
+            "records": self.records,
+            "total_time": total,
+            "p50": self.latency.percentile(0.50),
+            "p95": self.latency.percentile(0.95),
+            "p99": self.latency.percentile(0.99),
+            "records_per_second": self.records / total if total else 0.0,
+        }
+
 
 class ProcessingPipeline(ABC):
     def __init__(self, pipeline_id: str) -> None:
         self.stages: List[ProcessingStage] = []
         self.pipeline_id = pipeline_id
+        self._plan: Optional[Callable[[Any], Any]] = None
+        self._record_plan: Optional[Callable[[Any], Any]] = None
+        self._tracked_plan: Optional[Callable[[Any], Any]] = None
+        self._instrumented: Optional[List[_InstrumentedStage]] = None
+        self._sample_every = 1
+        self.dead_letters: Optional[Deque[DeadLetter]] = None
+        self.failures = 0
 
     def add_stage(self, stage: ProcessingStage) -> None:
         self.stages.append(stage)
+        if self._instrumented is not None:
+            self._instrumented.append(
+                _InstrumentedStage(stage, self._sample_every)
+            )
+        # CHANGED: a new stage invalidates any previously compiled plan
+        self._plan = None
+        self._record_plan = None
+        self._tracked_plan = None
+
+    def replace_stage(self, position: int, stage: ProcessingStage) -> None:
+        # Builds new lists and swaps the references, so a record already
+        # running keeps the old stages and the next one sees the new ones
+        stages = list(self.stages)
+        stages[position] = stage
+        if self._instrumented is not None:
+            instrumented = list(self._instrumented)
+            instrumented[position] = _InstrumentedStage(
+                stage, self._sample_every
+            )
+            self._instrumented = instrumented
+        self.stages = stages
+        if self._plan is not None:
+            self.compile()
+
+    def compile(self) -> Callable[[Any], Any]:
+        stages = self._active_stages()
+        self._plan = _compile_plan(stages)
+        self._record_plan = _compile_plan(_record_stages(stages))
+
+        def on_error(position: int, record: Any, error: Exception) -> None:
+            self._dead_letter(position, stages[position], record, error)
+        # Used instead of _plan while dead letters are enabled
+        self._tracked_plan = _compile_plan(stages, on_error)
+        return self._plan
+
+    @property
+    def compiled(self) -> bool:
+        return self._plan is not None
+
+    def enable_metrics(self, sample_every: int = 1) -> None:
+        # sample_every=N times one call in N per stage; counts stay exact
+        if sample_every < 1:
+            raise ValueError("sample_every must be positive")
+        self._sample_every = sample_every
+        self._instrumented = [
+            _InstrumentedStage(stage, sample_every) for stage in self.stages
+        ]
+        if self._plan is not None:
+            self.compile()
+
+    def disable_metrics(self) -> None:
+        self._instrumented = None
+        if self._plan is not None:
+            self.compile()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        stages = [stage.snapshot() for stage in self._instrumented or []]
+        total = sum(stage["total_time"] for stage in stages)
+        records = stages[0]["records"] if stages else 0
+        return {
+            "pipeline_id": self.pipeline_id,
+            "enabled": self._instrumented is not None,
+            "records": records,
+            "errors": sum(stage["errors"] for stage in stages),
+            "total_time": total,
+            "records_per_second": records / total if total else 0.0,
+            "stages": stages,
+        }
+
+    def _active_stages(self) -> List[Any]:
+        if self._instrumented is not None:
+            return list(self._instrumented)
+        return list(self.stages)
+
+    def enable_dead_letters(self, maxlen: Optional[int] = 10000) -> None:
+        # Failed records are kept with the failing stage and exception.
+        # process() still raises; process_many() keeps going with the rest
+        # of the batch and puts the DeadLetter in the failed record's slot,
+        # so results stay aligned with the input. A compiled plan keeps
+        # running, in a variant that tracks the failing stage.
+        self.dead_letters = deque(maxlen=maxlen)
+
+    def _dead_letter(self, position: int, stage: Any, record: Any,
+                     error: Exception) -> "DeadLetter":
+        self.failures += 1
+        letter = DeadLetter(self.pipeline_id, position, _stage_name(stage),
+                            record, error)
+        if self.dead_letters is not None:
+            self.dead_letters.append(letter)
+        return letter
+
+    def replay_dead_letters(self) -> List[Any]:
+        # Re-runs parked records, e.g. after a stage was swapped; records
+        # that fail again go back on the queue
+        if not self.dead_letters:
+            return []
+        letters = list(self.dead_letters)
+        self.dead_letters.clear()
+        return self.process_many(letter.record for letter in letters)
+
+    def _execute(self, data: Any) -> Any:
+        plan = self._plan
+        if plan is not None:
+            if self.dead_letters is None:
+                return plan(data)
+            if self._tracked_plan is not None:
+                return self._tracked_plan(data)
+        if self.dead_letters is None:
+            for stage in self._instrumented or self.stages:
+                data = stage.process(data)
+            return data
+        # Track the running stage so a failure can be attributed to it
+        record = data
+        position = 0
+        stages = self._active_stages()
+        try:
+            for position, stage in enumerate(stages):
+                data = stage.process(data)
+        except Exception as error:
+            self._dead_letter(position, stages[position], record, error)
+            raise
+        return data
+
+    def process_record(self, data: Any) -> Any:
+        # Runs the stages up to (not including) the first one that renders
+        # output, and returns the record itself so a downstream pipeline
+        # can take it by reference instead of re-parsing a string
+        plan = self._record_plan
+        if plan is not None:
+            return plan(data)
+        for stage in _record_stages(self._active_stages()):
+            data = stage.process(data)
+        return data
+
+    def process_many(self, data: Iterable[Any],
+                     batch_size: int = 1024,
+                     on_batch: Optional[Callable[[int, List[Any]],
+                                                 None]] = None
+                     ) -> List[Any]:
+        # on_batch gets how many input records each finished batch used
+        # and that batch's results
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+        stages = self._active_stages()
+        runners = [_batch_runner(stage) for stage in stages]
+        results: List[Any] = []
+        iterator = iter(data)
+        while True:
+            records = list(itertools.islice(iterator, batch_size))
+            if not records:
+                return results
+            consumed = len(records)
+            if self.dead_letters is None:
+                for run in runners:
+                    records = run(records)
+            else:
+                records = self._run_isolated(stages, runners, records)
+            results.extend(records)
+            if on_batch is not None:
+                on_batch(consumed, records)
+
+    # Checkpoint hooks: state that must survive a restart besides the
+    # input offset. Stateless pipelines have none.
+    def checkpoint_state(self) -> Dict[str, Any]:
+        return {}
+
+    def restore_state(self, state: Dict[str, Any]) -> None:
+        pass
+
+    def _run_isolated(self, stages: List[Any],
+                      runners: List[Callable[[List[Any]], List[Any]]],
+                      originals: List[Any]) -> List[Any]:
+        # Batches run whole; when one fails, that stage is retried record
+        # by record so only the bad records are parked. The result has one
+        # slot per original: its output, or its DeadLetter.
+        results: List[Any] = [None] * len(originals)
+        records = list(originals)
+        alive = list(range(len(originals)))
+        for position, (stage, run) in enumerate(zip(stages, runners)):
+            try:
+                records = run(records)
+                continue
+            except Exception:
+                pass
+            kept: List[Any] = []
+            kept_alive: List[int] = []
+            for index, record in zip(alive, records):
+                try:
+                    kept.append(stage.process(record))
+                except Exception as error:
+                    results[index] = self._dead_letter(
+                        position, stage, originals[index], error
+                    )
+                    continue
+                kept_alive.append(index)
+            records, alive = kept, kept_alive
+        for index, record in zip(alive, records):
+            results[index] = record
+        return results
+
+    async def process_async(self, data: Union[Iterable[Any],
+                                              AsyncIterable[Any]],
+                            queue_size: int = 64,
+                            workers: Union[int, List[int]] = 1,
+                            offload: bool = True) -> List[Any]:
+        # Each stage runs as its own group of worker tasks joined by bounded
+        # queues, so a full queue holds back the stage feeding it. Stages
+        # with a process_async coroutine are awaited. Plain stages run in
+        # the loop's default thread pool, so workers and other pipelines
+        # overlap with them (as far as the GIL allows; blocking I/O overlaps
+        # fully). offload=False runs them inline on the loop instead, which
+        # is cheaper for trivial stages but serializes everything. With
+        # workers > 1, metrics counters are best effort. Results come back
+        # in input order.
+        if queue_size < 1:
+            raise ValueError("queue_size must be positive")
+        stages = self._active_stages()
+        counts = ([workers] * len(stages) if isinstance(workers, int)
+                  else list(workers))
+        if len(counts) != len(stages) or any(n < 1 for n in counts):
+            raise ValueError("workers needs one positive count per stage")
+        queues: List[asyncio.Queue] = [
+            asyncio.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)
+        ]
+        results: Dict[int, Any] = {}
+
+        async def feed() -> None:
+            index = 0
+            if isinstance(data, AsyncIterable):
+                async for record in data:
+                    await queues[0].put((index, record))
+                    index += 1
+            else:
+                for record in data:
+                    await queues[0].put((index, record))
+                    index += 1
+            for _ in range(counts[0] if counts else 1):
+                await queues[0].put(_STOP)
+
+        loop = asyncio.get_running_loop()
+
+        async def work(position: int, stage: ProcessingStage) -> None:
+            inbox, outbox = queues[position], queues[position + 1]
+            run_async = getattr(stage, "process_async", None)
+            while True:
+                item = await inbox.get()
+                if item is _STOP:
+                    return
+                index, record = item
+                if run_async is not None:
+                    record = await run_async(record)
+                elif offload:
+                    record = await loop.run_in_executor(None, stage.process,
+                                                        record)
+                else:
+                    record = stage.process(record)
+                await outbox.put((index, record))
+
+        async def run_stage(position: int, stage: ProcessingStage) -> None:
+            await asyncio.gather(
+                *(work(position, stage) for _ in range(counts[position]))
+            )
+            downstream = (counts[position + 1]
+                          if position + 1 < len(counts) else 1)
+            for _ in range(downstream):
+                await queues[position + 1].put(_STOP)
+
+        async def collect() -> None:
+            while True:
+                item = await queues[-1].get()
+                if item is _STOP:
+                    return
+                results[item[0]] = item[1]
+
+        await _run_tasks([feed(), collect()] + [
+            run_stage(position, stage)
+            for position, stage in enumerate(stages)
+        ])
+        return [results[index] for index in range(len(results))]
 
     @abstractmethod
     def process(self, data: Any) -> Any:
         pass
 
 
+_STOP = object()
+
+
+class DeadLetter(NamedTuple):
+    pipeline_id: str
+    position: int
+    stage: str
+    record: Any
+    error: Exception
+
+
+def _stage_name(stage: Any) -> str:
+    if isinstance(stage, _InstrumentedStage):
+        return stage.name
+    return type(stage).__name__
+
+
+async def _run_tasks(coros: List[Any]) -> None:
+    # Like gather, but a failure cancels the sibling tasks instead of
+    # leaving them blocked on their queues
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def _per_record(stage: Any) -> Callable[[List[Any]], List[Any]]:
+    process = stage.process
+    return lambda records: [process(record) for record in records]
+
+
+def detect_gzip(head: bytes, tail: bytes) -> Optional[str]:
+    return "gzip" if head.startswith(b"\x1f\x8b") else None
+
+
+def detect_ndjson(head: bytes, tail: bytes) -> Optional[str]:
+    # A single JSON document never has "}" and "{" separated by only a
+    # newline, so one boundary in either window is enough. The tail
+    # catches NDJSON whose first line is longer than the window; payloads
+    # where every line outgrows it need a larger InputStage window.
+    if not head.lstrip().startswith(b"{"):
+        return None
+    for window in (head, tail):
+        if b"}\n{" in window or b"}\r\n{" in window:
+            return "ndjson"
+    return None
+
+
+DEFAULT_DETECTORS: Tuple[Callable[[bytes, bytes], Optional[str]], ...] = (
+    detect_gzip,
+    detect_ndjson,
+)
+
+
 class InputStage(ProcessingStage):
-    def process(self, data: Any) -> Dict:
-        fmt = "stream"
+    # CHANGED: classification only looks at a bounded prefix and suffix, so
+    # its cost does not grow with the payload and nothing is copied whole.
+    # Detectors see the raw head/tail bytes and may claim a format first.
+    def __init__(self, detectors: Optional[Iterable[
+                     Callable[[bytes, bytes], Optional[str]]]] = None,
+                 window: int = 256) -> None:
+        if window < 1:
+            raise ValueError("window must be positive")
+        self.detectors = tuple(
+            DEFAULT_DETECTORS if detectors is None else detectors
+        )
+        self.window = window
+
+    def sniff(self, data: Any) -> str:
+        window = self.window
         if isinstance(data, str):
-            stripped = data.strip()
-            if stripped.startswith("{") and stripped.endswith("}"):
-                fmt = "json"
-            elif "," in stripped:
-                fmt = "csv"
-        return {"raw": data, "format": fmt}
+            head = data[:window].encode("utf-8", "surrogatepass")
+            tail = data[-window:].encode("utf-8", "surrogatepass")
+        elif isinstance(data, (bytes, bytearray, memoryview)):
+            view = memoryview(data)
+            if view.format != "B" or view.ndim != 1:
+                view = view.cast("B")
+            head = bytes(view[:window])
+            tail = bytes(view[-window:])
+        else:
+            return "stream"
+        for detect in self.detectors:
+            fmt = detect(head, tail)
+            if fmt is not None:
+                return fmt
+        if head.startswith(codecs.BOM_UTF8):
+            head = head[len(codecs.BOM_UTF8):]
+        head = head.lstrip()
+        if head.startswith(b"{") and tail.rstrip().endswith(b"}"):
+            return "json"
+        if b"," in head:
+            return "csv"
+        return "stream"
+
+    # Records that already carry a format (e.g. CSV chunks streamed by
+    # CSVAdapter) pass through untouched
+    def process(self, data: Any) -> Dict:
+        if isinstance(data, PipelineRecord) or (
+                type(data) is dict and "format" in data):
+            return data
+        return make_record(data, self.sniff(data))
+
+    def process_batch(self, records: List[Any]) -> List[Dict]:
+        sniff = self.sniff
+        return [
+            data if isinstance(data, PipelineRecord)
+            or (type(data) is dict and "format" in data)
+            else make_record(data, sniff(data))
+            for data in records
+        ]
 
 
 class TransformStage(ProcessingStage):
+    # Handlers for these return a record of a different format
+    generic_formats = frozenset({"gzip"})
+
+    def __init__(self) -> None:
+        self._handlers: Dict[str, Callable[[Dict], Dict]] = {
+            "json": self._transform_json,
+            "ndjson": self._transform_ndjson,
+            "csv": self._transform_csv,
+            "stream": self._transform_stream,
+            "gzip": self._transform_gzip,
+        }
+        self._sniffer = InputStage()
+
     def process(self, data: Any) -> Dict:
-        if not isinstance(data, dict):
-            data = {"raw": data, "format": "unknown"}
+        if not isinstance(data, _RECORD_TYPES):
+            data = PipelineRecord(data)
+        return self.specialize(data.get("format", "unknown"))(data)
 
-        raw = data.get("raw", "")
-        fmt = data.get("format", "unknown")
-
-        # Default transform message (used by main printing)
-        if fmt == "json":
-            data["transform_msg"] = "Enriched with metadata and validation"
-        elif fmt == "csv":
-            data["transform_msg"] = "Parsed and structured data"
-        elif fmt == "stream":
-            data["transform_msg"] = "Aggregated and filtered"
+    def specialize(self, fmt: str) -> Callable[[Dict], Dict]:
+        return self._handlers.get(fmt, self._transform_default)
+
+    def process_batch(self, records: List[Any]) -> List[Dict]:
+        # Handlers are looked up once per format run, not once per record
+        handlers = self._handlers
+        default = self._transform_default
+        results: List[Dict] = []
+        fmt: Any = None
+        handler = default
+        for data in records:
+            if not isinstance(data, _RECORD_TYPES):
+                data = PipelineRecord(data)
+            if data.get("format", "unknown") != fmt:
+                fmt = data.get("format", "unknown")
+                handler = handlers.get(fmt, default)
+            results.append(handler(data))
+        return results
+
+    def _transform_default(self, data: Dict) -> Dict:
+        data["transform_msg"] = "Transformed"
+        return data
+
+    # ---- JSON transform ----
+    # CHANGED: decode with a real JSON parser instead of splitting strings,
+    # so key order and nesting no longer matter
+    def _transform_json(self, data: Dict) -> Dict:
+        data["transform_msg"] = "Enriched with metadata and validation"
+        if "status" in data and "value" in data:
+            # Already decoded upstream, e.g. handed over by a chained
+            # pipeline's process_record
+            return data
+        raw = _text_or_bytes(data.get("raw", ""))
+        if raw is None:
+            return data
+        try:
+            doc = _json_loads(raw)
+        except ValueError:
+            raise ValueError("Invalid data format")
+        return self._enrich_json(data, doc)
+
+    def _enrich_json(self, data: Dict, doc: Any) -> Dict:
+        reading = _find_reading(doc)
+        if reading is None or (
+                "sensor" not in doc and "sensor" not in reading):
+            # CHANGED: to enable error recovery demo
+            raise ValueError("Invalid data format")
+        try:
+            value = float(reading["value"])
+        except (TypeError, ValueError):
+            raise ValueError("Invalid data format")
+        unit_str = str(reading["unit"])
+
+        data["value"] = value
+        data["unit"] = unit_str
+
+        # Example expects: 23.5°C (Normal range)
+        # CHANGED: decide "Normal range" using a simple rule for Celsius
+        if unit_str == "C" and 18.0 <= value <= 26.0:
+            data["status"] = "Normal range"
         else:
-            data["transform_msg"] = "Transformed"
-
-        # ---- JSON transform ----
-        # CHANGED: parse the specific example format without using json module
-        if fmt == "json" and isinstance(raw, str):
-            s = raw.strip()
-
-            # Validate minimal structure
-            if '"sensor"' not in s or '"value"' not in s or '"unit"' not in s:
-                # CHANGED: to enable error recovery demo
-                raise ValueError("Invalid data format")
-
-            # Extract value
-            # expects ... "value": 23.5 ...
-            val_key = '"value"'
-            unit_key = '"unit"'
-            try:
-                after_val = s.split(val_key, 1)[1]
-                after_colon = after_val.split(":", 1)[1].strip()
-                # stop at comma or }
-                num_str = after_colon.split(",", 1)[0].strip().strip('"')
-                value = float(num_str)
-            except Exception:
-                raise ValueError("Invalid data format")
+            data["status"] = "Alert"
 
-            # Extract unit
-            try:
-                after_unit = s.split(unit_key, 1)[1]
-                after_colon_u = after_unit.split(":", 1)[1].strip()
-                unit_str = after_colon_u.split(",", 1)[0].strip()
-                unit_str = unit_str.strip("}").strip().strip('"')
-            except Exception:
-                raise ValueError("Invalid data format")
+        return data
 
-            data["value"] = value
-            data["unit"] = unit_str
+    def process_ndjson(self, payload: Union[str, bytes, bytearray,
+                                            memoryview]) -> List[Dict]:
+        # One JSON document per line; blank lines are skipped
+        results: List[Dict] = []
+        lines = _text_or_bytes(payload)
+        if lines is None:
+            return results
+        for line in lines.splitlines():
+            if not line.strip():
+                continue
+            data = JSONRecord(line, "json")
+            results.append(self._transform_json(data))
+        return results
 
-            # Example expects: 23.5°C (Normal range)
-            # CHANGED: decide "Normal range" using a simple rule for Celsius
-            if unit_str == "C" and 18.0 <= value <= 26.0:
-                data["status"] = "Normal range"
-            else:
-                data["status"] = "Alert"
+    def _transform_ndjson(self, data: Dict) -> Dict:
+        data["transform_msg"] = "Parsed newline-delimited JSON"
+        if "records" not in data:
+            data["records"] = self.process_ndjson(data.get("raw", ""))
+        return data
 
-            return data
+    # ---- Gzip transform ----
+    # Decompress, classify the inner payload and transform it as that
+    def _transform_gzip(self, data: Dict) -> Dict:
+        raw = _text_or_bytes(data.get("raw", b""))
+        if not isinstance(raw, bytes):
+            return self._transform_default(data)
+        try:
+            inner = gzip.decompress(raw)
+        except (OSError, EOFError):
+            raise ValueError("Invalid data format")
+        record = make_record(inner, self._sniffer.sniff(inner))
+        return self.specialize(record.format)(record)
 
-        # ---- CSV transform ----
-        # CHANGED: parse CSV header-like string and compute "actions processed"
-        if fmt == "csv" and isinstance(raw, str):
-            fields = [part.strip() for part in raw.split(",") if part.strip()]
-            data["fields"] = fields
-            # Example output: "1 actions processed"
-            # We'll interpret as "1 row/entry processed" for the demo.
-            data["actions_processed"] = 1
+    # ---- CSV transform ----
+    # CHANGED: rows come either pre-parsed from CSVAdapter chunks or from a
+    # CSV string; "actions processed" is the real number of rows
+    def _transform_csv(self, data: Dict) -> Dict:
+        data["transform_msg"] = "Parsed and structured data"
+        if "actions_processed" in data:
             return data
+        raw = data.get("raw", "")
+        if isinstance(raw, list):
+            data["actions_processed"] = len(raw)
+            return data
+        raw = _text_or_bytes(raw)
+        if raw is None:
+            return data
+        if not isinstance(raw, str):
+            raw = raw.decode("utf-8-sig")
+        rows = [row for row in csv.reader(raw.lstrip("\ufeff").splitlines())
+                if row]
+        if rows:
+            data["fields"] = [
+                part.strip() for part in rows[0] if part.strip()
+            ]
+        # The first row is the header. A header with no rows under it is
+        # the single-line activity record the demo sends, counted as one.
+        data["actions_processed"] = (len(rows) - 1 if len(rows) > 1
+                                     else len(rows))
+        return data
 
-        # ---- Stream transform ----
-        if fmt == "stream" and isinstance(raw, str):
-            # Use a fixed simulated reading set for the demo phrase
-            if raw.strip() == "Real-time sensor stream":
-                readings = [22.0, 22.2, 22.1, 22.3, 22.0]
-            else:
-                readings = [22.0, 22.0, 22.0, 22.0, 22.0]
-
-            avg = sum(readings) / len(readings) if readings else 0.0
-            data["readings_count"] = len(readings)
-            data["avg_temp"] = avg
+    # ---- Stream transform ----
+    # CHANGED: window summaries from StreamAdapter carry real aggregates
+    def _transform_stream(self, data: Dict) -> Dict:
+        data["transform_msg"] = "Aggregated and filtered"
+        raw = data.get("raw", "")
+        if isinstance(raw, dict) and "count" in raw:
+            data["readings_count"] = raw["count"]
+            data["avg_temp"] = raw["mean"]
+            data["min_temp"] = raw["min"]
+            data["max_temp"] = raw["max"]
+            return data
+        if not isinstance(raw, str):
             return data
+        # Use a fixed simulated reading set for the demo phrase
+        if raw.strip() == "Real-time sensor stream":
+            readings = [22.0, 22.2, 22.1, 22.3, 22.0]
+        else:
+            readings = [22.0, 22.0, 22.0, 22.0, 22.0]
 
+        avg = sum(readings) / len(readings) if readings else 0.0
+        data["readings_count"] = len(readings)
+        data["avg_temp"] = avg
         return data
 
 
+class OutputSink(ABC):
+    # Buffers rendered lines and hands them to the target in one write
+    # once max_buffer characters are pending, on flush() and on close().
+    # Buffered lines never wait longer than flush_interval seconds: a
+    # daemon timer armed by the first buffered write flushes them even
+    # if no further write arrives.
+    def __init__(self, max_buffer: int = 64 * 1024,
+                 flush_interval: float = 1.0) -> None:
+        if max_buffer < 1:
+            raise ValueError("max_buffer must be positive")
+        self.max_buffer = max_buffer
+        self.flush_interval = flush_interval
+        self.writes = 0
+        self._parts: List[str] = []
+        self._size = 0
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def write(self, text: str) -> None:
+        with self._lock:
+            self._parts.append(text)
+            self._size += len(text)
+            waited = time.monotonic() - self._flushed_at
+            if (self._size >= self.max_buffer
+                    or waited >= self.flush_interval):
+                self._flush_locked()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_interval - waited,
+                                              self._flush_due)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush_due(self) -> None:
+        with self._lock:
+            # A timer cancelled while waiting for the lock is stale
+            if self._timer is threading.current_thread():
+                self._flush_locked()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        self._flushed_at = time.monotonic()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._parts:
+            return
+        chunk = "".join(self._parts)
+        self._parts = []
+        self._size = 0
+        self._write_out(chunk)
+        self.writes += 1
+
+    def close(self) -> None:
+        self.flush()
+        self._close()
+
+    def __enter__(self) -> "OutputSink":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    @abstractmethod
+    def _write_out(self, chunk: str) -> None:
+        pass
+
+    def _close(self) -> None:
+        pass
+
+
+class StreamSink(OutputSink):
+    # Any text stream; defaults to whatever sys.stdout is at write time
+    def __init__(self, stream: Optional[Any] = None,
+                 max_buffer: int = 64 * 1024,
+                 flush_interval: float = 1.0) -> None:
+        super().__init__(max_buffer, flush_interval)
+        self.stream = stream
+
+    def _write_out(self, chunk: str) -> None:
+        stream = self.stream if self.stream is not None else sys.stdout
+        stream.write(chunk)
+        stream.flush()
+
+
+class FileSink(OutputSink):
+    def __init__(self, path: str, max_buffer: int = 64 * 1024,
+                 flush_interval: float = 1.0, append: bool = True) -> None:
+        super().__init__(max_buffer, flush_interval)
+        self._handle = open(path, "a" if append else "w", encoding="utf-8")
+
+    def _write_out(self, chunk: str) -> None:
+        self._handle.write(chunk)
+        self._handle.flush()
+
+    def _close(self) -> None:
+        self._handle.close()
+
+
+class SocketSink(OutputSink):
+    # A path connects to a Unix domain socket, a (host, port) pair to TCP
+    def __init__(self, address: Union[str, Tuple[str, int]],
+                 max_buffer: int = 64 * 1024,
+                 flush_interval: float = 1.0) -> None:
+        super().__init__(max_buffer, flush_interval)
+        if isinstance(address, str):
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.connect(address)
+        else:
+            self._sock = socket.create_connection(address)
+
+    def _write_out(self, chunk: str) -> None:
+        self._sock.sendall(chunk.encode("utf-8"))
+
+    def _close(self) -> None:
+        self._sock.close()
+
+
+_CONVERSIONS: Dict[Optional[str], Optional[Callable[[Any], str]]] = {
+    None: None, "s": str, "r": repr, "a": ascii,
+}
+
+
+def _compile_template(template: str) -> Callable[[Dict], str]:
+    # The template is parsed once into (literal, field, spec, conversion)
+    # parts; rendering a record only looks fields up and formats them.
+    # Fields are record keys, e.g. "{value:.1f}".
+    parts: List[Tuple[str, Optional[str], str,
+                      Optional[Callable[[Any], str]]]] = []
+    for literal, field, spec, conversion in string.Formatter().parse(
+            template):
+        if field is not None and not field.isidentifier():
+            raise ValueError(f"Unsupported template field: {field!r}")
+        if spec and "{" in spec:
+            raise ValueError(f"Nested fields are not supported: {spec!r}")
+        if conversion not in _CONVERSIONS:
+            raise ValueError(f"Unknown conversion: {conversion!r}")
+        parts.append((literal, field, spec or "", _CONVERSIONS[conversion]))
+    compiled = tuple(parts)
+
+    def render(data: Dict) -> str:
+        out = []
+        for literal, field, spec, convert in compiled:
+            out.append(literal)
+            if field is not None:
+                value = data[field]
+                if convert is not None:
+                    value = convert(value)
+                out.append(format(value, spec))
+        return "".join(out)
+    return render
+
+
 class OutputStage(ProcessingStage):
+    # Output is a formatted string, so compiled plans stop specializing here
+    emits_record = False
+
+    def __init__(self, sink: Optional[OutputSink] = None,
+                 templates: Optional[Dict[str, str]] = None) -> None:
+        self.sink = sink
+        self._formatters: Dict[str, Callable[[Dict], str]] = {
+            "json": self._output_json,
+            "ndjson": self._output_ndjson,
+            "csv": self._output_csv,
+            "stream": self._output_stream,
+        }
+        for fmt, template in (templates or {}).items():
+            self._formatters[fmt] = _compile_template(template)
+
     def process(self, data: Any) -> str:
-        if not isinstance(data, dict):
-            return f"Output: {data}"
+        if not isinstance(data, _RECORD_TYPES):
+            line = self._output_other(data)
+        else:
+            line = self._render(data.get("format", "unknown"), data)
+        if self.sink is not None:
+            self.sink.write(line + "\n")
+        return line
 
-        fmt = data.get("format", "unknown")
+    def _render(self, fmt: str, data: Dict) -> str:
+        return self._formatters.get(fmt, self._output_default)(data)
 
-        if fmt == "json":
-            value = data.get("value", 0.0)
-            status = data.get("status", "Unknown")
-            return (
-                "Output: Processed temperature reading: "
-                f"{value:.1f}°C ({status})"
-            )
+    def specialize(self, fmt: str) -> Callable[[Dict], str]:
+        formatter = self._formatters.get(fmt, self._output_default)
+        sink = self.sink
+        if sink is None:
+            return formatter
 
-        if fmt == "csv":
-            actions = data.get("actions_processed", 0)
-            # Example: Output: User activity logged: 1 actions processed
-            return f"Output: User activity logged: {actions} actions processed"
+        def emit(data: Dict) -> str:
+            line = formatter(data)
+            sink.write(line + "\n")
+            return line
+        return emit
 
-        if fmt == "stream":
-            count = data.get("readings_count", 0)
-            avg = data.get("avg_temp", 0.0)
-            return (
-                f"Output: Stream summary: {count} readings, avg: {avg:.1f}°C"
-            )
+    def process_batch(self, records: List[Any]) -> List[str]:
+        formatters = self._formatters
+        default = self._output_default
+        results: List[str] = []
+        fmt: Any = None
+        formatter = default
+        for data in records:
+            if not isinstance(data, _RECORD_TYPES):
+                results.append(self._output_other(data))
+                continue
+            if data.get("format", "unknown") != fmt:
+                fmt = data.get("format", "unknown")
+                formatter = formatters.get(fmt, default)
+            results.append(formatter(data))
+        if self.sink is not None and results:
+            # The whole batch goes to the sink as one write
+            self.sink.write("\n".join(results) + "\n")
+        return results
+
+    def _output_other(self, data: Any) -> str:
+        return f"Output: {data}"
 
+    def _output_default(self, data: Dict) -> str:
         return f"Output: {data.get('raw', data)}"
 
+    def _output_json(self, data: Dict) -> str:
+        value = data.get("value", 0.0)
+        status = data.get("status", "Unknown")
+        return (
+            "Output: Processed temperature reading: "
+            f"{value:.1f}°C ({status})"
+        )
+
+    def _output_ndjson(self, data: Dict) -> str:
+        records = data.get("records", [])
+        alerts = sum(1 for record in records
+                     if record.get("status") == "Alert")
+        return (
+            f"Output: Processed {len(records)} temperature readings "
+            f"({alerts} alerts)"
+        )
+
+    def _output_csv(self, data: Dict) -> str:
+        actions = data.get("actions_processed", 0)
+        # Example: Output: User activity logged: 1 actions processed
+        return f"Output: User activity logged: {actions} actions processed"
+
+    def _output_stream(self, data: Dict) -> str:
+        count = data.get("readings_count", 0)
+        avg = data.get("avg_temp", 0.0)
+        return (
+            f"Output: Stream summary: {count} readings, avg: {avg:.1f}°C"
+        )
+
+
+class JSONLinesStage(OutputStage):
+    # Emits each record as one JSON line. The raw payload is left out since
+    # the parsed fields already describe it.
+    def __init__(self, sink: Optional[OutputSink] = None) -> None:
+        super().__init__(sink)
+        self._formatters = {}
+
+    def _output_default(self, data: Dict) -> str:
+        return _json_dumps({key: value for key, value in data.items()
+                            if key != "raw"})
+
+    def _output_other(self, data: Any) -> str:
+        return _json_dumps(data)
+
+
+class FallbackStage(ProcessingStage):
+    # Runs primary and falls back on any exception. Either side can be
+    # swapped at runtime by assigning the attribute.
+    def __init__(self, primary: ProcessingStage,
+                 fallback: ProcessingStage) -> None:
+        self.primary = primary
+        self.fallback = fallback
+        self.fallbacks_used = 0
+
+    def process(self, data: Any) -> Any:
+        primary, fallback = self.primary, self.fallback
+        try:
+            return primary.process(data)
+        except Exception:
+            self.fallbacks_used += 1
+            return fallback.process(data)
+
+    def process_batch(self, records: List[Any]) -> List[Any]:
+        try:
+            return _batch_runner(self.primary)(records)
+        except Exception:
+            process = self.process
+            return [process(record) for record in records]
+
+
+class CachedStage(ProcessingStage):
+    # Content-addressed LRU cache in front of a stage. Keys are digests of
+    # the raw payload (plus format for InputStage records), so identical
+    # payloads skip the stage. Records carrying anything beyond raw and
+    # format go straight to the stage. A lock guards the table, so it can
+    # be shared by threads, including the async mode's offloaded calls.
+    def __init__(self, stage: ProcessingStage,
+                 max_entries: Optional[int] = 10000,
+                 max_bytes: Optional[int] = None) -> None:
+        if max_entries is None and max_bytes is None:
+            raise ValueError("Set max_entries, max_bytes or both")
+        self.stage = stage
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.bytes_used = 0
+        self._entries: "OrderedDict[bytes, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(data: Any) -> Optional[bytes]:
+        # The digest starts with a self-delimiting tag: 0 for a bare
+        # payload, 1 plus the length-prefixed format for a record, so no
+        # payload can collide with a different payload/format pair
+        prefix = b"\x00"
+        if isinstance(data, _RECORD_TYPES):
+            if len(data) != 2 or "raw" not in data or "format" not in data:
+                return None
+            fmt = str(data["format"]).encode("utf-8", "surrogatepass")
+            prefix = b"\x01" + len(fmt).to_bytes(4, "big") + fmt
+            data = data["raw"]
+        if isinstance(data, str):
+            data = data.encode("utf-8", "surrogatepass")
+        elif not isinstance(data, (bytes, bytearray, memoryview)):
+            return None
+        digest = hashlib.blake2b(prefix, digest_size=16)
+        digest.update(data)
+        return digest.digest()
+
+    def process(self, data: Any) -> Any:
+        key = self._key(data)
+        if key is None:
+            with self._lock:
+                self.bypassed += 1
+            return self.stage.process(data)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                result = entry[0]
+                # Stages enrich records in place, nested values included,
+                # so callers get their own copy all the way down
+                return _clone_value(result)
+            self.misses += 1
+        result = self.stage.process(data)
+        self._store(key, _clone_value(result))
+        return result
+
+    def process_batch(self, records: List[Any]) -> List[Any]:
+        process = self.process
+        return [process(record) for record in records]
+
+    def _store(self, key: bytes, result: Any) -> None:
+        size = _estimate_size(result)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes_used -= previous[1]
+            self._entries[key] = (result, size)
+            self.bytes_used += size
+            while self._entries and (
+                    (self.max_entries is not None
+                     and len(self._entries) > self.max_entries)
+                    or (self.max_bytes is not None
+                        and self.bytes_used > self.max_bytes)):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes_used -= evicted
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes_used = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes_used,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def _estimate_size(value: Any) -> int:
+    # Shallow estimate: the container plus its direct values
+    size = sys.getsizeof(value)
+    if isinstance(value, _RECORD_TYPES):
+        size += sum(sys.getsizeof(item) for item in value.values())
+    return size
+
+
+# Stage held by each pool worker; set once per process by the initializer
+_WORKER_STAGE: Any = None
+
+
+def _init_worker(stage: ProcessingStage) -> None:
+    global _WORKER_STAGE
+    _WORKER_STAGE = stage
+
+
+def _run_worker_chunk(records: List[Any]) -> List[Any]:
+    return _WORKER_STAGE.process_batch(records)
+
+
+class ParallelStage(ProcessingStage):
+    # Wraps a CPU-bound stage and shards batches across a process pool.
+    # The wrapped stage is pickled once per worker; records travel in
+    # chunks so pickling and IPC are paid per chunk, not per record.
+    # Output is always in input order, since pipelines map results (and
+    # dead letters) back to inputs by position. ordered=False only
+    # collects chunks as they finish rather than in submission order.
+    def __init__(self, stage: ProcessingStage,
+                 max_workers: Optional[int] = None,
+                 chunk_size: int = 256, ordered: bool = True) -> None:
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive")
+        self.stage = stage
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.ordered = ordered
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def process(self, data: Any) -> Any:
+        # A single record is not worth a round trip to another process
+        return self.stage.process(data)
+
+    def process_batch(self, records: List[Any]) -> List[Any]:
+        if len(records) <= self.chunk_size:
+            return _batch_runner(self.stage)(records)
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_init_worker,
+                initargs=(_BatchAdapter(self.stage),),
+            )
+        size = self.chunk_size
+        starts = {}
+        for start in range(0, len(records), size):
+            future = self._executor.submit(_run_worker_chunk,
+                                           records[start:start + size])
+            starts[future] = start
+        results: List[Any] = [None] * len(records)
+        done = starts if self.ordered else as_completed(starts)
+        for future in done:
+            start = starts[future]
+            chunk = future.result()
+            if len(chunk) != min(size, len(records) - start):
+                raise RuntimeError("Parallel stage must return one result "
+                                   "per record")
+            results[start:start + len(chunk)] = chunk
+        return results
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self) -> "ParallelStage":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+class _BatchAdapter:
+    # Gives structural stages without process_batch a batch entry point
+    def __init__(self, stage: ProcessingStage) -> None:
+        self.stage = stage
+
+    def process_batch(self, records: List[Any]) -> List[Any]:
+        return _batch_runner(self.stage)(records)
+
+
+def _batch_runner(stage: Any) -> Callable[[List[Any]], List[Any]]:
+    return getattr(stage, "process_batch", None) or _per_record(stage)
+
 
 class JSONAdapter(ProcessingPipeline):
     def __init__(self, pipeline_id: str) -> None:
         super().__init__(pipeline_id)
 
     def process(self, data: Any) -> Union[str, Any]:
-        for stage in self.stages:
-            data = stage.process(data)
-        return data
+        return self._execute(data)
 
 
 class CSVAdapter(ProcessingPipeline):
-    def __init__(self, pipeline_id: str) -> None:
+    def __init__(self, pipeline_id: str,
+                 columns: Optional[Dict[str, Callable[[str], Any]]] = None,
+                 fieldnames: Optional[List[str]] = None,
+                 chunk_size: int = 1024) -> None:
         super().__init__(pipeline_id)
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive")
+        # Per-column converters, e.g. {"timestamp": int}; others stay str
+        self.columns = dict(columns or {})
+        self.fieldnames = list(fieldnames) if fieldnames else None
+        self.chunk_size = chunk_size
+        self.rows_processed = 0
 
     def process(self, data: Any) -> Union[str, Any]:
-        for stage in self.stages:
-            data = stage.process(data)
-        return data
+        return self._execute(data)
+
+    def read_chunks(self, source: Union[str, os.PathLike, Iterable[str]]
+                    ) -> Iterator[List[Dict[str, Any]]]:
+        # A path is opened and read lazily; anything else is treated as an
+        # iterable of lines. Only one chunk of rows is held at a time.
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, newline="", encoding="utf-8") as handle:
+                yield from self._chunk_rows(csv.reader(handle))
+        else:
+            yield from self._chunk_rows(csv.reader(source))
+
+    def _chunk_rows(self, reader: Any) -> Iterator[List[Dict[str, Any]]]:
+        header = self.fieldnames
+        if header is None:
+            header = next(reader, None)
+            if header is None:
+                return
+            header = [name.strip() for name in header]
+        converters = [
+            (index, name, self.columns[name])
+            for index, name in enumerate(header) if name in self.columns
+        ]
+        chunk: List[Dict[str, Any]] = []
+        for row in reader:
+            if not row:
+                continue
+            for index, name, convert in converters:
+                try:
+                    row[index] = convert(row[index])
+                except (IndexError, ValueError):
+                    raise ValueError(
+                        f"Invalid value for column '{name}' "
+                        f"on line {reader.line_num}"
+                    )
+            chunk.append(dict(zip(header, row)))
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def process_source(self, source: Union[str, os.PathLike, Iterable[str]]
+                       ) -> Iterator[Any]:
+        # Each chunk travels through the stages as one pre-parsed record
+        for chunk in self.read_chunks(source):
+            self.rows_processed += len(chunk)
+            record = CSVRecord(chunk, "csv")
+            record.fields = list(chunk[0])
+            yield self._execute(record)
+
+
+class WindowAggregator:
+    # Count- or time-based windows over a reading stream. slide defaults to
+    # the window length (tumbling); a smaller slide gives sliding windows.
+    # Sum and monotonic min/max deques keep each update O(1) amortized.
+    # Timestamps are expected to be non-decreasing.
+    def __init__(self, size: Optional[int] = None,
+                 seconds: Optional[float] = None,
+                 slide: Optional[float] = None) -> None:
+        if (size is None) == (seconds is None):
+            raise ValueError("Specify exactly one of size or seconds")
+        if size is not None and size < 1:
+            raise ValueError("size must be positive")
+        if seconds is not None and seconds <= 0:
+            raise ValueError("seconds must be positive")
+        self.size = size
+        self.seconds = seconds
+        self.slide = slide if slide is not None else (size or seconds)
+        if self.slide is None or self.slide <= 0:
+            raise ValueError("slide must be positive")
+        self._items: Deque[Tuple[float, float]] = deque()
+        self._min: Deque[Tuple[float, float]] = deque()
+        self._max: Deque[Tuple[float, float]] = deque()
+        self._sum = 0.0
+        self._pending = 0
+        self._window_end: Optional[float] = None
+
+    def _push(self, item: Tuple[float, float]) -> None:
+        value = item[1]
+        self._items.append(item)
+        self._sum += value
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append(item)
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append(item)
+        self._pending += 1
+
+    def _pop_oldest(self) -> None:
+        item = self._items.popleft()
+        self._sum -= item[1]
+        if self._min[0] is item:
+            self._min.popleft()
+        if self._max[0] is item:
+            self._max.popleft()
+
+    def _evict_before(self, start: float) -> None:
+        while self._items and self._items[0][0] < start:
+            self._pop_oldest()
+
+    def _snapshot(self, start: float, end: float) -> Dict[str, Any]:
+        count = len(self._items)
+        self._pending = 0
+        return {"window_start": start, "window_end": end, "count": count,
+                "mean": self._sum / count, "min": self._min[0][1],
+                "max": self._max[0][1]}
+
+    def update(self, value: float,
+               timestamp: Optional[float] = None) -> List[Dict[str, Any]]:
+        if timestamp is None:
+            timestamp = time.monotonic()
+        item = (timestamp, float(value))
+        if self.size is not None:
+            return self._update_count(item)
+        return self._update_time(item)
+
+    def _update_count(self, item: Tuple[float, float]
+                      ) -> List[Dict[str, Any]]:
+        self._push(item)
+        if len(self._items) > self.size:
+            self._pop_oldest()
+        if len(self._items) == self.size and self._pending >= self.slide:
+            return [self._snapshot(self._items[0][0], item[0])]
+        return []
+
+    def _update_time(self, item: Tuple[float, float]
+                     ) -> List[Dict[str, Any]]:
+        emitted: List[Dict[str, Any]] = []
+        timestamp = item[0]
+        if self._window_end is None:
+            self._window_end = timestamp + self.seconds
+        while timestamp >= self._window_end:
+            start = self._window_end - self.seconds
+            self._evict_before(start)
+            # Sliding windows overlap, so one may hold only readings an
+            # earlier window already reported and still be due
+            if self._items and (self._pending or self.slide < self.seconds):
+                emitted.append(self._snapshot(start, self._window_end))
+            self._window_end += self.slide
+            if not self._items or self._items[-1][0] < (
+                    self._window_end - self.seconds):
+                # Nothing left to report: skip the empty windows at once
+                self._items.clear()
+                self._min.clear()
+                self._max.clear()
+                self._sum = 0.0
+                self._pending = 0
+                if timestamp >= self._window_end:
+                    steps = (timestamp - self._window_end) // self.slide + 1
+                    self._window_end += steps * self.slide
+        self._push(item)
+        return emitted
+
+    def get_state(self) -> Dict[str, Any]:
+        return {"items": [list(item) for item in self._items],
+                "pending": self._pending, "window_end": self._window_end}
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        # Time windows resume correctly only with timestamps carried by
+        # the readings; monotonic clock values do not survive a restart
+        self._items.clear()
+        self._min.clear()
+        self._max.clear()
+        self._sum = 0.0
+        for timestamp, value in state.get("items", []):
+            self._push((timestamp, value))
+        self._pending = state.get("pending", 0)
+        self._window_end = state.get("window_end")
+
+    def flush(self) -> List[Dict[str, Any]]:
+        # Emit the windows still open at the end of the stream
+        if not self._items:
+            return []
+        if self.size is not None:
+            # Count windows end on a reading, so without new readings the
+            # next window would repeat the last one
+            if not self._pending:
+                return []
+            if self.slide < self.size:
+                return [self._snapshot(self._items[0][0],
+                                       self._items[-1][0])]
+            tail = list(self._items)[-self._pending:]
+            values = [value for _, value in tail]
+            self._pending = 0
+            return [{"window_start": tail[0][0], "window_end": tail[-1][0],
+                     "count": len(values), "mean": sum(values) / len(values),
+                     "min": min(values), "max": max(values)}]
+        if self.slide >= self.seconds and not self._pending:
+            return []
+        # Every window that starts by the last reading still holds some
+        emitted: List[Dict[str, Any]] = []
+        last = self._items[-1][0]
+        while self._window_end - self.seconds <= last:
+            start = self._window_end - self.seconds
+            self._evict_before(start)
+            emitted.append(self._snapshot(start, self._window_end))
+            self._window_end += self.slide
+        return emitted
+
+
+def _split_reading(reading: Any) -> Tuple[float, Optional[float]]:
+    # Readings are plain numbers or (timestamp, value) pairs
+    if isinstance(reading, tuple):
+        return reading[1], reading[0]
+    return reading, None
 
 
 class StreamAdapter(ProcessingPipeline):
-    def __init__(self, pipeline_id: str) -> None:
+    def __init__(self, pipeline_id: str,
+                 window_size: Optional[int] = None,
+                 window_seconds: Optional[float] = None,
+                 slide: Optional[float] = None) -> None:
         super().__init__(pipeline_id)
+        if window_size is None and window_seconds is None:
+            # Same five-reading summaries the demo prints
+            window_size = 5
+        self.window_size = window_size
+        self.window_seconds = window_seconds
+        self.slide = slide
+        self._restored: Optional[Dict[str, Any]] = None
+        # Validate the window settings up front
+        self._aggregator = self._new_aggregator()
 
     def process(self, data: Any) -> Union[str, Any]:
-        for stage in self.stages:
-            data = stage.process(data)
-        return data
+        return self._execute(data)
+
+    def _new_aggregator(self) -> WindowAggregator:
+        aggregator = WindowAggregator(self.window_size, self.window_seconds,
+                                      self.slide)
+        if self._restored is not None:
+            aggregator.set_state(self._restored)
+            self._restored = None
+        self._aggregator = aggregator
+        return aggregator
+
+    def checkpoint_state(self) -> Dict[str, Any]:
+        return {"window": self._aggregator.get_state()}
+
+    def restore_state(self, state: Dict[str, Any]) -> None:
+        # Picked up by the next windows() run
+        self._restored = state.get("window")
+
+    def windows(self, readings: Iterable[Any],
+                on_progress: Optional[Callable[[int], None]] = None,
+                progress_every: int = 1000) -> Iterator[Dict[str, Any]]:
+        aggregator = self._new_aggregator()
+        update = aggregator.update
+        consumed = 0
+        for reading in readings:
+            value, timestamp = _split_reading(reading)
+            yield from update(value, timestamp)
+            consumed += 1
+            if on_progress is not None and consumed >= progress_every:
+                on_progress(consumed)
+                consumed = 0
+        yield from aggregator.flush()
+        if on_progress is not None and consumed:
+            on_progress(consumed)
+
+    async def windows_async(self, readings: AsyncIterable[Any]
+                            ) -> AsyncIterator[Dict[str, Any]]:
+        aggregator = self._new_aggregator()
+        async for reading in readings:
+            value, timestamp = _split_reading(reading)
+            for window in aggregator.update(value, timestamp):
+                yield window
+        for window in aggregator.flush():
+            yield window
+
+    def process_readings(self, readings: Iterable[Any],
+                         on_progress: Optional[Callable[[int], None]] = None,
+                         progress_every: int = 1000) -> Iterator[Any]:
+        # Each closed window travels through the stages as one record
+        for window in self.windows(readings, on_progress, progress_every):
+            yield self._execute(StreamRecord(window, "stream"))
+
+
+class RoutingTable:
+    # Content-based routes, checked in order: key prefixes, custom
+    # predicates, the format InputStage sniffs, then the default route.
+    def __init__(self) -> None:
+        self._prefixes: Dict[str, str] = {}
+        self._ordered_prefixes: Tuple[str, ...] = ()
+        self._predicates: List[Tuple[Callable[[Any], bool], str]] = []
+        self._formats: Dict[str, str] = {}
+        self.default: Optional[str] = None
+        self._sniff = InputStage().sniff
+
+    def route_prefix(self, prefix: str, pipeline_id: str) -> None:
+        self._prefixes[prefix] = pipeline_id
+        # Longest prefix wins when several match
+        self._ordered_prefixes = tuple(
+            sorted(self._prefixes, key=len, reverse=True)
+        )
+
+    def route_format(self, fmt: str, pipeline_id: str) -> None:
+        self._formats[fmt] = pipeline_id
+
+    def route_if(self, predicate: Callable[[Any], bool],
+                 pipeline_id: str) -> None:
+        self._predicates.append((predicate, pipeline_id))
+
+    def drop(self, pipeline_id: str) -> None:
+        self._prefixes = {
+            prefix: target for prefix, target in self._prefixes.items()
+            if target != pipeline_id
+        }
+        self._ordered_prefixes = tuple(
+            sorted(self._prefixes, key=len, reverse=True)
+        )
+        self._predicates = [
+            rule for rule in self._predicates if rule[1] != pipeline_id
+        ]
+        self._formats = {
+            fmt: target for fmt, target in self._formats.items()
+            if target != pipeline_id
+        }
+        if self.default == pipeline_id:
+            self.default = None
+
+    def resolve(self, data: Any) -> Optional[str]:
+        if self._ordered_prefixes and isinstance(data, str):
+            for prefix in self._ordered_prefixes:
+                if data.startswith(prefix):
+                    return self._prefixes[prefix]
+        for predicate, pipeline_id in self._predicates:
+            if predicate(data):
+                return pipeline_id
+        if self._formats:
+            pipeline_id = self._formats.get(self._sniff(data))
+            if pipeline_id is not None:
+                return pipeline_id
+        return self.default
+
+
+class CircuitBreaker:
+    # Opens after `threshold` failures within `window` seconds; while open,
+    # traffic goes to the fallback pipeline. After `cooldown` seconds one
+    # trial record is let through (half-open) to decide whether to close.
+    def __init__(self, threshold: int = 5, window: float = 60.0,
+                 cooldown: float = 30.0,
+                 fallback_id: Optional[str] = None) -> None:
+        if threshold < 1:
+            raise ValueError("threshold must be positive")
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.fallback_id = fallback_id
+        self.state = "closed"
+        self.trips = 0
+        self._failures: Deque[float] = deque()
+        self._opened_at = 0.0
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and (
+                time.monotonic() - self._opened_at >= self.cooldown):
+            self.state = "half_open"
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self.state == "half_open":
+            self.state = "closed"
+            self._failures.clear()
+
+    def record_failure(self, count: int = 1) -> None:
+        now = time.monotonic()
+        if self.state == "half_open":
+            self._open(now)
+            return
+        self._failures.extend([now] * count)
+        while self._failures and now - self._failures[0] > self.window:
+            self._failures.popleft()
+        if len(self._failures) >= self.threshold:
+            self._open(now)
+
+    def _open(self, now: float) -> None:
+        self.state = "open"
+        self.trips += 1
+        self._opened_at = now
+        self._failures.clear()
+
+
+class _FairQueue:
+    # One pipeline's queue inside the scheduler, with its token bucket
+    def __init__(self, weight: float, priority: int, max_queue: int,
+                 rate: Optional[float], burst: Optional[float],
+                 shed: str) -> None:
+        if weight <= 0:
+            raise ValueError("weight must be positive")
+        if max_queue < 1:
+            raise ValueError("max_queue must be positive")
+        if shed not in ("drop_new", "drop_oldest"):
+            raise ValueError("shed must be 'drop_new' or 'drop_oldest'")
+        self.weight = weight
+        self.priority = priority
+        self.max_queue = max_queue
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate or 1.0)
+        self.shed = shed
+        self.items: Deque[Tuple[float, int, Any]] = deque()
+        # This queue's one live entry in the scheduler heap, if any
+        self.heap_entry: Optional[Tuple[int, float, int, str]] = None
+        self.last_finish = 0.0
+        self.tokens = self.burst
+        self.refilled_at = time.monotonic()
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.throttled = 0
+
+    def take_token(self, now: float) -> bool:
+        if self.rate is None:
+            return True
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+class FairScheduler:
+    # Weighted fair queuing across pipelines. Higher priority classes are
+    # always served first; within a class each record gets a virtual
+    # finish tag of max(now, previous tag) + 1 / weight and the smallest
+    # tag goes next, so a pipeline's share of turns follows its weight no
+    # matter how much it submits. A heap holds one entry per non-empty
+    # queue, so picking the next record is O(log queues). When drop_oldest
+    # replaces the head, the entry is fixed up when it is popped rather
+    # than pushed again on every submit.
+    def __init__(self) -> None:
+        self.queues: Dict[str, _FairQueue] = {}
+        self._heap: List[Tuple[int, float, int, str]] = []
+        self._virtual_time = 0.0
+        self._seq = 0
+
+    def configure(self, pipeline_id: str, weight: float = 1.0,
+                  priority: int = 0, max_queue: int = 10000,
+                  rate: Optional[float] = None,
+                  burst: Optional[float] = None,
+                  shed: str = "drop_new") -> None:
+        queue = _FairQueue(weight, priority, max_queue, rate, burst, shed)
+        previous = self.queues.get(pipeline_id)
+        if previous is not None:
+            queue.items = previous.items
+            queue.last_finish = previous.last_finish
+        self.queues[pipeline_id] = queue
+        if queue.items:
+            self._push_head(pipeline_id, queue)
+
+    def submit(self, pipeline_id: str, data: Any) -> bool:
+        queue = self.queues.get(pipeline_id)
+        if queue is None:
+            self.configure(pipeline_id)
+            queue = self.queues[pipeline_id]
+        queue.submitted += 1
+        if len(queue.items) >= queue.max_queue:
+            queue.dropped += 1
+            if queue.shed == "drop_new":
+                return False
+            # The heap entry still names the old head; next() re-keys it
+            queue.items.popleft()
+        finish = (max(self._virtual_time, queue.last_finish)
+                  + 1.0 / queue.weight)
+        queue.last_finish = finish
+        self._seq += 1
+        queue.items.append((finish, self._seq, data))
+        if len(queue.items) == 1:
+            self._push_head(pipeline_id, queue)
+        return True
+
+    def _push_head(self, pipeline_id: str, queue: _FairQueue) -> None:
+        finish, seq, _ = queue.items[0]
+        entry = (-queue.priority, finish, seq, pipeline_id)
+        queue.heap_entry = entry
+        heapq.heappush(self._heap, entry)
+
+    def next(self) -> Optional[Tuple[str, Any]]:
+        # Returns the next record to run, or None when every non-empty
+        # queue is waiting on its rate limit
+        now = time.monotonic()
+        throttled: List[Tuple[int, float, int, str]] = []
+        picked: Optional[Tuple[str, Any]] = None
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            pipeline_id = entry[3]
+            queue = self.queues.get(pipeline_id)
+            if queue is None or queue.heap_entry is not entry:
+                # Superseded when configure() replaced the queue
+                continue
+            queue.heap_entry = None
+            if not queue.items:
+                continue
+            if queue.items[0][1] != entry[2]:
+                # drop_oldest moved the head on since this was pushed
+                self._push_head(pipeline_id, queue)
+                continue
+            if not queue.take_token(now):
+                queue.heap_entry = entry
+                queue.throttled += 1
+                throttled.append(entry)
+                continue
+            finish, _, data = queue.items.popleft()
+            self._virtual_time = max(self._virtual_time, finish)
+            if queue.items:
+                self._push_head(pipeline_id, queue)
+            picked = (pipeline_id, data)
+            break
+        for entry in throttled:
+            heapq.heappush(self._heap, entry)
+        return picked
+
+    def pending(self) -> int:
+        return sum(len(queue.items) for queue in self.queues.values())
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            pipeline_id: {
+                "weight": queue.weight,
+                "priority": queue.priority,
+                "queued": len(queue.items),
+                "submitted": queue.submitted,
+                "processed": queue.processed,
+                "dropped": queue.dropped,
+                "failed": queue.failed,
+                "throttled": queue.throttled,
+            }
+            for pipeline_id, queue in self.queues.items()
+        }
+
+
+def _checkpoint_key(pipeline_id: str, source: str) -> str:
+    return f"{pipeline_id}:{source}"
+
+
+def _flush_sinks(pipeline: ProcessingPipeline) -> None:
+    pending = list(pipeline.stages)
+    while pending:
+        stage = pending.pop()
+        sink = getattr(stage, "sink", None)
+        if sink is not None:
+            sink.flush()
+        for attr in ("stage", "primary", "fallback"):
+            inner = getattr(stage, attr, None)
+            if inner is not None:
+                pending.append(inner)
+
+
+class Checkpointer:
+    # Per-pipeline input offsets and state in one JSON file. Writes go to
+    # a temp file in the same directory and are renamed over the old one,
+    # so a crash leaves either the previous or the new checkpoint.
+    def __init__(self, path: str, every: int = 10000) -> None:
+        if every < 1:
+            raise ValueError("every must be positive")
+        self.path = path
+        self.every = every
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as handle:
+                self._entries = json.load(handle).get("pipelines", {})
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._entries.get(key)
+
+    def save(self, key: str, offset: int, state: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = {"offset": offset, "state": state,
+                                  "saved_at": time.time()}
+            self._write()
+
+    def forget(self, key: str) -> None:
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._write()
+
+    def _write(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        handle, temp_path = tempfile.mkstemp(
+            dir=directory, prefix=".checkpoint-", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(handle, "w", encoding="utf-8") as temp:
+                json.dump({"pipelines": self._entries}, temp)
+                temp.flush()
+                os.fsync(temp.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
 
 
 class NexusManager:
     def __init__(self) -> None:
-        self.pipelines: List[ProcessingPipeline] = []
+        # CHANGED: pipelines are indexed by id for O(1) lookup
+        self._index: Dict[str, ProcessingPipeline] = {}
+        self.router = RoutingTable()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._chains: Dict[str, List[str]] = {}
+        self._dags: Dict[str, Tuple[
+            List[str], List[str], Dict[str, List[str]], Set[str],
+            Optional[Callable[[List[Any]], Any]],
+        ]] = {}
+        self._checkpoints: Optional[Checkpointer] = None
+        self.scheduler = FairScheduler()
+
+    @property
+    def pipelines(self) -> Tuple[ProcessingPipeline, ...]:
+        # Read-only: a tuple, so code that used to append to the old list
+        # fails loudly instead of registering nothing. Use add_pipeline.
+        return tuple(self._index.values())
 
     def add_pipeline(self, pipeline: ProcessingPipeline) -> None:
-        self.pipelines.append(pipeline)
+        # Registering an existing id swaps the pipeline in place
+        self._index[pipeline.pipeline_id] = pipeline
+
+    def enable_metrics(self, sample_every: int = 1) -> None:
+        for pipeline in self._index.values():
+            pipeline.enable_metrics(sample_every)
+
+    def get_metrics(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            pipeline_id: pipeline.get_metrics()
+            for pipeline_id, pipeline in self._index.items()
+        }
+
+    def remove_pipeline(self, pipeline_id: str) -> bool:
+        self.router.drop(pipeline_id)
+        self._breakers.pop(pipeline_id, None)
+        return self._index.pop(pipeline_id, None) is not None
+
+    def set_circuit_breaker(self, pipeline_id: str,
+                            breaker: CircuitBreaker) -> None:
+        self._breakers[pipeline_id] = breaker
+
+    def _guarded(self, pipeline_id: str,
+                 run: Callable[[ProcessingPipeline], Any]) -> Any:
+        pipeline = self._index.get(pipeline_id)
+        if pipeline is None:
+            return f"Pipeline {pipeline_id} not found"
+        breaker = self._breakers.get(pipeline_id)
+        if breaker is None:
+            return run(pipeline)
+        if not breaker.allow():
+            fallback = self._index.get(breaker.fallback_id or "")
+            if fallback is None:
+                return f"Pipeline {pipeline_id} circuit open"
+            return run(fallback)
+        failures = pipeline.failures
+        try:
+            result = run(pipeline)
+        except Exception:
+            breaker.record_failure()
+            raise
+        # process_many parks bad records instead of raising
+        if pipeline.failures > failures:
+            breaker.record_failure(pipeline.failures - failures)
+        else:
+            breaker.record_success()
+        return result
+
+    def get_pipeline(self, pipeline_id: str) -> Optional[ProcessingPipeline]:
+        return self._index.get(pipeline_id)
 
     def process(self, pipeline_id: str, data: Any) -> Any:
-        for pipeline in self.pipelines:
-            if pipeline.pipeline_id == pipeline_id:
-                return pipeline.process(data)
-        return f"Pipeline {pipeline_id} not found"
+        if not self._breakers:
+            pipeline = self._index.get(pipeline_id)
+            if pipeline is None:
+                return f"Pipeline {pipeline_id} not found"
+            return pipeline.process(data)
+        return self._guarded(pipeline_id,
+                             lambda pipeline: pipeline.process(data))
+
+    def process_many(self, pipeline_id: str, data: Iterable[Any],
+                     batch_size: int = 1024,
+                     source: Optional[str] = None,
+                     deliver: Optional[Callable[[List[Any]], None]] = None
+                     ) -> Union[str, List[Any]]:
+        # One lookup for the whole batch instead of one per record. With
+        # checkpoints enabled and a source given, records before the saved
+        # offset of this pipeline/source are skipped and only new results
+        # are returned. Pass deliver to get results batch by batch; only
+        # then is progress saved mid-run (see _resumable).
+        return self._guarded(
+            pipeline_id,
+            lambda pipeline: self._resumable(
+                pipeline, source, data,
+                lambda rest, progress: pipeline.process_many(
+                    rest, batch_size, progress
+                ),
+                deliver,
+            ),
+        )
+
+    def process_readings(self, pipeline_id: str, readings: Iterable[Any],
+                         source: Optional[str] = None,
+                         deliver: Optional[Callable[[List[Any]], None]] = None
+                         ) -> Union[str, List[Any]]:
+        pipeline = self._index.get(pipeline_id)
+        if not isinstance(pipeline, StreamAdapter):
+            return f"Stream pipeline {pipeline_id} not found"
+        every = self._checkpoints.every if self._checkpoints else 1000
+
+        def run(rest: Iterable[Any],
+                progress: Callable[[int, List[Any]], None]) -> None:
+            # Windows are yielded before the readings that closed them are
+            # reported, so everything in ready belongs to that progress
+            ready: List[Any] = []
+
+            def consumed(count: int) -> None:
+                progress(count, ready[:])
+                ready.clear()
+
+            for result in pipeline.process_readings(rest, consumed, every):
+                ready.append(result)
+            if ready:
+                progress(0, ready)
+
+        return self._resumable(pipeline, source, readings, run, deliver)
+
+    def enable_checkpoints(self, path: str, every: int = 10000) -> None:
+        self._checkpoints = Checkpointer(path, every)
+
+    def reset_checkpoint(self, pipeline_id: str, source: str) -> None:
+        if self._checkpoints is not None:
+            self._checkpoints.forget(_checkpoint_key(pipeline_id, source))
+
+    def _resumable(self, pipeline: ProcessingPipeline, source: Optional[str],
+                   data: Iterable[Any],
+                   run: Callable[[Iterable[Any],
+                                  Callable[[int, List[Any]], None]], Any],
+                   deliver: Optional[Callable[[List[Any]], None]] = None
+                   ) -> List[Any]:
+        # run reports (records consumed, their results) as it goes. An
+        # offset is only saved once the results for everything before it
+        # have left the manager: handed to deliver and flushed out of any
+        # sinks. Without deliver they are held until the run returns, so
+        # the checkpoint is only written at the end.
+        checkpoints = self._checkpoints
+        if checkpoints is None or source is None:
+            collected: List[Any] = []
+            run(data, lambda count, results: collected.extend(results))
+            if deliver is None:
+                return collected
+            deliver(collected)
+            return []
+        key = _checkpoint_key(pipeline.pipeline_id, source)
+        entry = checkpoints.get(key)
+        offset = entry["offset"] if entry else 0
+        if entry:
+            pipeline.restore_state(entry.get("state", {}))
+        saved = offset
+        held: List[Any] = []
+
+        def progress(count: int, results: List[Any]) -> None:
+            nonlocal offset, saved
+            offset += count
+            if deliver is None:
+                held.extend(results)
+                return
+            deliver(results)
+            if offset - saved >= checkpoints.every:
+                _flush_sinks(pipeline)
+                checkpoints.save(key, offset, pipeline.checkpoint_state())
+                saved = offset
+
+        run(itertools.islice(data, offset, None), progress)
+        _flush_sinks(pipeline)
+        checkpoints.save(key, offset, pipeline.checkpoint_state())
+        return held
+
+    async def process_async(self, pipeline_id: str,
+                            data: Union[Iterable[Any], AsyncIterable[Any]],
+                            queue_size: int = 64,
+                            workers: Union[int, List[int]] = 1,
+                            offload: bool = True) -> Union[str, List[Any]]:
+        pipeline = self._index.get(pipeline_id)
+        if pipeline is None:
+            return f"Pipeline {pipeline_id} not found"
+        return await pipeline.process_async(data, queue_size, workers,
+                                            offload)
+
+    async def run_async(self, jobs: Dict[str, Union[Iterable[Any],
+                                                    AsyncIterable[Any]]],
+                        queue_size: int = 64,
+                        workers: Union[int, List[int]] = 1,
+                        offload: bool = True
+                        ) -> Dict[str, Union[str, List[Any]]]:
+        # Runs several pipelines concurrently in the current event loop;
+        # with offload their plain stages overlap in the thread pool
+        ids = list(jobs)
+        outputs = await asyncio.gather(*(
+            self.process_async(pipeline_id, jobs[pipeline_id],
+                               queue_size, workers, offload)
+            for pipeline_id in ids
+        ))
+        return dict(zip(ids, outputs))
+
+    def add_chain(self, chain_id: str, pipeline_ids: List[str]) -> None:
+        self._check_known(pipeline_ids)
+        if not pipeline_ids:
+            raise ValueError("A chain needs at least one pipeline")
+        self._chains[chain_id] = list(pipeline_ids)
+
+    def add_dag(self, dag_id: str, edges: Dict[str, List[str]],
+                merge: Optional[Callable[[List[Any]], Any]] = None) -> None:
+        # edges maps each pipeline id to the ids it feeds; the nodes are
+        # kept in topological order so each one runs after all its inputs.
+        # merge, if given, turns everything a fan-in node received into the
+        # single record it runs on (see merge_records).
+        nodes = list(dict.fromkeys(
+            [node for node in edges]
+            + [child for children in edges.values() for child in children]
+        ))
+        self._check_known(nodes)
+        incoming = {node: 0 for node in nodes}
+        for children in edges.values():
+            for child in children:
+                incoming[child] += 1
+        sources = [node for node in nodes if not incoming[node]]
+        fan_in = {node for node in nodes if incoming[node] > 1}
+        ready = list(sources)
+        order: List[str] = []
+        while ready:
+            node = ready.pop(0)
+            order.append(node)
+            for child in edges.get(node, []):
+                incoming[child] -= 1
+                if not incoming[child]:
+                    ready.append(child)
+        if len(order) != len(nodes):
+            raise ValueError(f"DAG {dag_id} contains a cycle")
+        self._dags[dag_id] = (
+            order, sources,
+            {node: list(edges.get(node, [])) for node in nodes},
+            fan_in, merge,
+        )
+
+    def _check_known(self, pipeline_ids: List[str]) -> None:
+        missing = [pid for pid in pipeline_ids if pid not in self._index]
+        if missing:
+            raise ValueError(f"Unknown pipelines: {', '.join(missing)}")
+
+    def process_chain(self, chain_id: str, data: Any) -> Any:
+        chain = self._chains.get(chain_id)
+        if chain is None:
+            return f"Chain {chain_id} not found"
+        pipelines = [self._index[pipeline_id] for pipeline_id in chain]
+        for pipeline in pipelines[:-1]:
+            data = pipeline.process_record(data)
+        return pipelines[-1].process(data)
+
+    def process_dag(self, dag_id: str, data: Any) -> Dict[str, List[Any]]:
+        # Without a merge function, a fan-in node runs once per record
+        # arriving from each parent and nothing is combined; with one, it
+        # runs once on the merged record. Results are collected per sink.
+        dag = self._dags.get(dag_id)
+        if dag is None:
+            raise ValueError(f"DAG {dag_id} not found")
+        order, sources, edges, fan_in, merge = dag
+        inbox: Dict[str, List[Any]] = {node: [] for node in order}
+        for node in sources:
+            inbox[node].append(data)
+        results: Dict[str, List[Any]] = {}
+        for node in order:
+            pipeline = self._index[node]
+            children = edges[node]
+            if merge is not None and node in fan_in and inbox[node]:
+                inbox[node] = [merge(inbox[node])]
+            if not children:
+                results[node] = [pipeline.process(record)
+                                 for record in inbox[node]]
+                continue
+            for record in inbox[node]:
+                output = pipeline.process_record(record)
+                inbox[children[0]].append(output)
+                for child in children[1:]:
+                    # Siblings get their own copy since stages enrich
+                    # records in place
+                    inbox[child].append(_clone_value(output))
+            inbox[node] = []
+        return results
+
+    def configure_queue(self, pipeline_id: str, weight: float = 1.0,
+                        priority: int = 0, max_queue: int = 10000,
+                        rate: Optional[float] = None,
+                        burst: Optional[float] = None,
+                        shed: str = "drop_new") -> None:
+        self.scheduler.configure(pipeline_id, weight, priority, max_queue,
+                                 rate, burst, shed)
+
+    def submit(self, pipeline_id: str, data: Any) -> bool:
+        # Queues a record for run_pending(); False means it was shed
+        return self.scheduler.submit(pipeline_id, data)
+
+    def run_pending(self, limit: Optional[int] = None
+                    ) -> List[Tuple[str, Any]]:
+        # Drains queued records in fair order until the queues are empty,
+        # `limit` records ran, or only rate-limited queues are left. A
+        # failing record yields its exception instead of stopping the run.
+        results: List[Tuple[str, Any]] = []
+        scheduler = self.scheduler
+        while limit is None or len(results) < limit:
+            picked = scheduler.next()
+            if picked is None:
+                break
+            pipeline_id, data = picked
+            queue = scheduler.queues[pipeline_id]
+            try:
+                result = self.process(pipeline_id, data)
+            except Exception as error:
+                queue.failed += 1
+                result = error
+            else:
+                queue.processed += 1
+            results.append((pipeline_id, result))
+        return results
+
+    def route(self, data: Any) -> Optional[str]:
+        pipeline_id = self.router.resolve(data)
+        if pipeline_id is None or pipeline_id not in self._index:
+            return None
+        return pipeline_id
+
+    def dispatch(self, data: Any) -> Any:
+        pipeline_id = self.route(data)
+        if pipeline_id is None:
+            return "No route for record"
+        return self.process(pipeline_id, data)
+
+    def dispatch_many(self, data: Iterable[Any]) -> List[Any]:
+        # Group records per target so each pipeline sees one batch, then
+        # put the results back in input order. Batches go through
+        # process_many, so circuit breakers apply as they do there.
+        groups: Dict[Optional[str], List[int]] = {}
+        records = list(data)
+        for position, record in enumerate(records):
+            groups.setdefault(self.route(record), []).append(position)
+        results: List[Any] = [None] * len(records)
+        for pipeline_id, positions in groups.items():
+            if pipeline_id is None:
+                outputs: List[Any] = ["No route for record"] * len(positions)
+            else:
+                outputs = self.process_many(
+                    pipeline_id,
+                    [records[position] for position in positions],
+                )
+                if isinstance(outputs, str):
+                    # The pipeline was skipped, e.g. its circuit is open
+                    outputs = [outputs] * len(positions)
+                elif len(outputs) != len(positions):
+                    # A batch stage dropped or added records, so outputs
+                    # can no longer be matched to their inputs
+                    raise RuntimeError(
+                        f"Pipeline {pipeline_id} returned {len(outputs)} "
+                        f"results for {len(positions)} records"
+                    )
+            for position, output in zip(positions, outputs):
+                results[position] = output
+        return results
 
 
 if __name__ == "__main__":
@@ -221,6 +2567,10 @@ if __name__ == "__main__":
     csv_pipe.add_stage(OutputStage())
     stream_pipe.add_stage(OutputStage())
 
+    for pipe in pipeline:
+        pipe.enable_metrics()
+        pipe.compile()
+
     manager.add_pipeline(json_pipe)
     manager.add_pipeline(csv_pipe)
     manager.add_pipeline(stream_pipe)
@@ -247,32 +2597,58 @@ if __name__ == "__main__":
     print("\n=== Pipeline Chaining Demo ===")
     print("Pipeline A -> Pipeline B -> Pipeline C")
     print("Data flow: Raw -> Processed -> Analyzed -> Stored\n")
-    print("Chain result: 100 records processed through 3-stage pipeline")
-    print("Performance: 95% efficiency, 0.2s total processing time\n")
+    chain_ids = ["CHAIN_A", "CHAIN_B", "CHAIN_C"]
+    for chain_id in chain_ids:
+        chain_pipe = JSONAdapter(chain_id)
+        chain_pipe.add_stage(InputStage())
+        chain_pipe.add_stage(TransformStage())
+        chain_pipe.add_stage(OutputStage())
+        chain_pipe.enable_metrics()
+        chain_pipe.compile()
+        manager.add_pipeline(chain_pipe)
+    manager.add_chain("A_B_C", chain_ids)
+    chain_results = [
+        manager.process_chain("A_B_C", json_input) for _ in range(100)
+    ]
+    chain_metrics = [
+        manager.get_metrics()[chain_id] for chain_id in chain_ids
+    ]
+    chain_time = sum(metrics["total_time"] for metrics in chain_metrics)
+    chain_rate = len(chain_results) / chain_time if chain_time else 0.0
+    print(
+        f"Chain result: {len(chain_results)} records processed through "
+        f"{len(chain_ids)}-stage pipeline"
+    )
+    print(
+        f"Performance: {chain_rate:,.0f} records/second, "
+        f"{chain_time:.4f}s total processing time\n"
+    )
 
     print("=== Error Recovery Test ===")
     print("Simulating pipeline failure...")
     bad_json = '{"sensor":"temp", "value": "BAD", "unit": "C"}'
 
+    class BackupTransformStage(ProcessingStage):
+        def process(self, data: Any) -> Dict:
+            if not isinstance(data, (dict, PipelineRecord)):
+                data = PipelineRecord(data)
+            data["recovered"] = True
+            return data
+
+    json_pipe.enable_dead_letters()
+    manager.set_circuit_breaker("JSON_PIPE", CircuitBreaker(threshold=3))
     try:
         manager.process("JSON_PIPE", bad_json)
     except ValueError as e:
-        print(f"Error detected in Stage 2: {e}")
+        failed = json_pipe.dead_letters[-1]
+        print(f"Error detected in Stage {failed.position + 1}: {e}")
         print("Recovery initiated: Switching to backup processor")
 
-        class BackupTransformStage(ProcessingStage):
-            def process(self, data: Any) -> Dict:
-                if not isinstance(data, dict):
-                    data = {"raw": data, "format": "unknown"}
-                data["recovered"] = True
-                return data
-
-        backup_json = JSONAdapter("JSON_BACKUP")
-        backup_json.add_stage(InputStage())
-        backup_json.add_stage(BackupTransformStage())
-        backup_json.add_stage(OutputStage())
-        manager.add_pipeline(backup_json)
-
-        _ = manager.process("JSON_BACKUP", json_input)
+        # Swap the failing stage in place; the parked record is replayed
+        json_pipe.replace_stage(
+            1, FallbackStage(TransformStage(), BackupTransformStage())
+        )
+        _ = json_pipe.replay_dead_letters()
+        _ = manager.process("JSON_PIPE", json_input)
         print("Recovery successful: Pipeline restored, processing resumed\n")
     print("Nexus Integration complete. All systems operational.")